@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from thumbnails import THUMBNAIL_PREFIX, ThumbnailCache
+from registry import DEFAULT_CHARACTER, StoreRegistry
+from xlsx_store import CharacterAppStore
+
+SECTION_ROUTES = {"stats": "stats", "inventory": "inventory", "skills": "skills_tree"}
+EVENTS_HEARTBEAT = 15.0
+JSON_TYPE = "application/json; charset=utf-8"
+IMMUTABLE = "public, max-age=31536000, immutable"
+CHARACTER_PATH = re.compile(r"^/c/([^/?#]+)(.*)$")
+CHARACTER_HEADER = "X-Character"
+
+
+@dataclass
+class Response:
+    status: HTTPStatus
+    body: bytes = b""
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Asset:
+    path: Path
+    stamp: tuple
+    size: int
+    content_type: str
+    digest: str
+    body: bytes | None = None
+    variants: dict[str, bytes] = field(default_factory=dict)
+    deps: tuple[Path, ...] = ()
+
+
+class StaticAssets:
+    COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+    PRELOAD = ("templates", "static")
+    ASSET_URL = re.compile(r'((?:src|href)=")(/static/[^"?#]+)(")')
+
+    def __init__(self, root: Path, inline_limit: int = 256 * 1024, thumbnails: ThumbnailCache | None = None):
+        self.root = root.resolve()
+        self.inline_limit = inline_limit
+        self.thumbnails = thumbnails
+        self._assets: dict[Path, Asset] = {}
+        for folder in self.PRELOAD:
+            for path in sorted((self.root / folder).rglob("*")):
+                if path.is_file():
+                    self.get(path)
+
+    def resolve(self, target: str) -> Path | None:
+        path = unquote(urlparse(target).path)
+        if self.thumbnails and path.startswith("/" + THUMBNAIL_PREFIX):
+            return self.thumbnails.path_for(path)
+        if path == "/":
+            path = "/templates/index.html"
+        parts = [part for part in posixpath.normpath(path).split("/") if part not in {"", ".", ".."}]
+        file = self.root.joinpath(*parts)
+        return file if file.is_file() else None
+
+    @staticmethod
+    def _stamp(paths) -> tuple:
+        return tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, paths))
+
+    def get(self, path: Path) -> Asset:
+        asset = self._assets.get(path)
+        if asset is None or asset.stamp != self._stamp((path, *asset.deps)):
+            asset = self._load(path)
+            self._assets[path] = asset
+        return asset
+
+    def _load(self, path: Path) -> Asset:
+        stamp = self._stamp((path,))
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if stamp[0][1] > self.inline_limit:
+            digest = hashlib.sha1()
+            with open(path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(1 << 16), b""):
+                    digest.update(chunk)
+            return Asset(path, stamp, stamp[0][1], content_type, digest.hexdigest()[:16])
+        body = path.read_bytes()
+        deps = []
+        if content_type == "text/html":
+            body = self.ASSET_URL.sub(lambda m: f"{m.group(1)}{self._versioned(m.group(2), deps)}{m.group(3)}", body.decode("utf-8")).encode("utf-8")
+            stamp = self._stamp((path, *deps))
+        asset = Asset(path, stamp, len(body), content_type, hashlib.sha1(body).hexdigest()[:16], body, deps=tuple(deps))
+        if content_type.startswith(self.COMPRESSIBLE) and len(body) > 512:
+            asset.variants["gzip"] = gzip.compress(body, 9, mtime=0)
+            if brotli is not None:
+                asset.variants["br"] = brotli.compress(body)
+        return asset
+
+    def _versioned(self, url: str, deps: list[Path]) -> str:
+        path = self.resolve(url)
+        if path is None:
+            return url
+        deps.append(path)
+        return f"{url}?v={self.get(path).digest}"
+
+    @staticmethod
+    def encoding(asset: Asset, accept_encoding: str) -> str | None:
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+        return next((name for name in ("br", "gzip") if name in asset.variants and name in accepted), None)
+
+    def response(self, target: str, accept_encoding: str = "", if_none_match: str = "") -> tuple[Response, Asset | None]:
+        path = self.resolve(target)
+        if path is None:
+            return not_found(), None
+        asset = self.get(path)
+        encoding = self.encoding(asset, accept_encoding)
+        etag = f'"{asset.digest}-{encoding}"' if encoding else f'"{asset.digest}"'
+        immutable = parse_qs(urlparse(target).query).get("v", [""])[0] == asset.digest
+        headers = {"Content-Type": asset.content_type, "ETag": etag, "Cache-Control": IMMUTABLE if immutable else "no-cache"}
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, etag):
+            return Response(HTTPStatus.NOT_MODIFIED, b"", headers), None
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(HTTPStatus.OK, asset.variants[encoding], headers), None
+        if asset.body is not None:
+            return Response(HTTPStatus.OK, asset.body, headers), None
+        return Response(HTTPStatus.OK, b"", headers), asset
+
+
+def json_response(payload, status: HTTPStatus = HTTPStatus.OK) -> Response:
+    return Response(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), {"Content-Type": JSON_TYPE})
+
+
+def not_found() -> Response:
+    return json_response({"ok": False, "error": "Not found"}, HTTPStatus.NOT_FOUND)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def cached_response(body: bytes, etag: str, if_none_match: str, cache_control: str = "no-cache", content_type: str = JSON_TYPE) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(HTTPStatus.NOT_MODIFIED, b"", headers)
+    return Response(HTTPStatus.OK, body, {"Content-Type": content_type, **headers})
+
+
+def route_character(target: str, header: str = "") -> tuple[str, str]:
+    match = CHARACTER_PATH.match(target)
+    if match is None:
+        return header.strip() or DEFAULT_CHARACTER, target
+    rest = match.group(2)
+    return unquote(match.group(1)), rest if rest.startswith("/") else "/" + rest
+
+
+def content_length(value: str | None) -> int | None:
+    value = (value or "").strip() or "0"
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+def invalid_length() -> Response:
+    return json_response({"ok": False, "error": "Content-Length invalide"}, HTTPStatus.BAD_REQUEST)
+
+
+def unknown_character() -> Response:
+    return json_response({"ok": False, "error": "Personnage inconnu"}, HTTPStatus.NOT_FOUND)
+
+
+def state_response(store: CharacterAppStore, character: str, path: str, if_none_match: str = "") -> Response:
+    if path == "/api/state":
+        version, body = store.encoded_state()
+        return cached_response(body, f'"{store.incarnation}-{character}-{version}"', if_none_match)
+    section = path[len("/api/state/"):] if path.startswith("/api/state/") else ""
+    if section not in SECTION_ROUTES:
+        return not_found()
+    version, body = store.encoded_section(SECTION_ROUTES[section])
+    return cached_response(body, f'"{store.incarnation}-{character}-{section}-{version}"', if_none_match)
+
+
+def nonblocking_get(registry: StoreRegistry, character: str, target: str, if_none_match: str = "") -> Response | None:
+    path = urlparse(target).path
+    if not path.startswith("/api/state") or path == "/api/state/shop":
+        return None
+    with registry.try_lease(character) as store:
+        return state_response(store, character, path, if_none_match) if store is not None else None
+
+
+def api_get(registry: StoreRegistry, character: str, target: str, if_none_match: str = "") -> Response | None:
+    parsed = urlparse(target)
+    catalog = registry.catalog
+    if parsed.path == "/api/state/shop":
+        index = catalog.index()
+        return cached_response(json.dumps(index, ensure_ascii=False).encode("utf-8"), f'"{index["catalog"]}"', if_none_match)
+    if parsed.path.startswith("/api/shop/"):
+        sheet = catalog.sheet(unquote(parsed.path[len("/api/shop/"):]))
+        if sheet is None:
+            return not_found()
+        immutable = parse_qs(parsed.query).get("v", [""])[0] == catalog.version
+        return cached_response(sheet.body, f'"{catalog.version}"', if_none_match, IMMUTABLE if immutable else "no-cache")
+    if parsed.path == "/api/characters":
+        return json_response({"characters": registry.characters(), "loaded": registry.metrics()["loaded"]})
+    if not parsed.path.startswith("/api/") or parsed.path == "/api/events":
+        return None
+    with registry.lease(character) as store:
+        if store is None:
+            return unknown_character()
+        if parsed.path.startswith("/api/state"):
+            return state_response(store, character, parsed.path, if_none_match)
+        if parsed.path == "/api/metrics":
+            return json_response({**store.metrics(), "registry": registry.metrics()})
+    return not_found()
+
+
+def api_post(registry: StoreRegistry, character: str, target: str, body: bytes) -> Response:
+    path = urlparse(target).path
+    if path not in {"/api/action", "/api/actions"}:
+        return not_found()
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return json_response({"ok": False, "error": "JSON invalide"}, HTTPStatus.BAD_REQUEST)
+    with registry.lease(character) as store:
+        if store is None:
+            return unknown_character()
+        if path == "/api/action":
+            return json_response(store.apply_action(payload))
+        if isinstance(payload, list):
+            payload = {"actions": payload}
+        return json_response(store.apply_actions(payload.get("actions", []), payload.get("base_version"), payload.get("incarnation")))
+
+
+def sse_message(event: dict) -> bytes:
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['version']}\nevent: {event['type']}\ndata: {data}\n\n".encode("utf-8")
+
+
+SSE_HEADERS = {"Content-Type": "text/event-stream; charset=utf-8", "Cache-Control": "no-cache"}
+SSE_PING = b": ping\n\n"
@@ -1,54 +1,121 @@
 from __future__ import annotations
 
 import argparse
-import json
+import asyncio
 import os
+import queue
+import signal
 import socket
 from http import HTTPStatus
-from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from urllib.parse import urlparse
 
-from xlsx_store import CharacterAppStore
+from api import CHARACTER_HEADER, EVENTS_HEARTBEAT, SSE_HEADERS, SSE_PING, Response, StaticAssets, api_get, api_post, content_length, invalid_length, route_character, sse_message, unknown_character
+from async_server import serve
+from registry import StoreRegistry
 
 ROOT = Path(__file__).parent
 
 
-class AppHandler(SimpleHTTPRequestHandler):
-    store = CharacterAppStore(ROOT)
+class AppHandler(BaseHTTPRequestHandler):
+    registry: StoreRegistry | None = None
+    assets: StaticAssets | None = None
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=str(ROOT), **kwargs)
+    def _route(self) -> tuple[str, str]:
+        return route_character(self.path, self.headers.get(CHARACTER_HEADER, ""))
 
     def do_GET(self):
-        parsed = urlparse(self.path)
-        if parsed.path == "/api/state":
-            self._send_json(self.store.build_state())
+        character, target = self._route()
+        if urlparse(target).path == "/api/events":
+            self._stream_events(character)
             return
-        if parsed.path == "/":
-            self.path = "/templates/index.html"
-        return super().do_GET()
+        response = api_get(self.registry, character, target, self.headers.get("If-None-Match", ""))
+        if response is not None:
+            self._send(response)
+            return
+        self._send_static(target)
+
+    def do_HEAD(self):
+        self._send_static(self._route()[1], head_only=True)
 
     def do_POST(self):
-        parsed = urlparse(self.path)
-        if parsed.path == "/api/action":
-            length = int(self.headers.get("Content-Length", "0"))
-            payload = json.loads(self.rfile.read(length) if length else b"{}")
-            result = self.store.apply_action(payload)
-            self._send_json(result)
+        length = content_length(self.headers.get("Content-Length"))
+        if length is None:
+            self.close_connection = True
+            self._send(invalid_length())
             return
-        self.send_error(HTTPStatus.NOT_FOUND, "Not found")
+        character, target = self._route()
+        self._send(api_post(self.registry, character, target, self.rfile.read(length) if length else b""))
 
-    def _send_json(self, payload: dict):
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        self.send_response(HTTPStatus.OK)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
+    def _send(self, response: Response, head_only: bool = False, length: int | None = None):
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        if response.status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Length", str(len(response.body) if length is None else length))
         self.end_headers()
-        self.wfile.write(body)
+        if not head_only:
+            self.wfile.write(response.body)
+
+    def _send_static(self, target: str, head_only: bool = False):
+        response, asset = self.assets.response(target, self.headers.get("Accept-Encoding", ""), self.headers.get("If-None-Match", ""))
+        if asset is None:
+            self._send(response, head_only)
+            return
+        with open(asset.path, "rb") as fh:
+            self._send(response, True, asset.size)
+            if not head_only:
+                self.connection.sendfile(fh)
+
+    def _stream_events(self, character: str):
+        store = self.registry.acquire(character)
+        if store is None:
+            self._send(unknown_character())
+            return
+        events = store.events.subscribe()
+        try:
+            self.send_response(HTTPStatus.OK)
+            for name, value in SSE_HEADERS.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(sse_message({"type": "version", "version": store.version, "incarnation": store.incarnation}))
+            self.wfile.flush()
+            while True:
+                try:
+                    event = events.get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    self.wfile.write(SSE_PING)
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    return
+                self.wfile.write(sse_message(event))
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            store.events.unsubscribe(events)
+            self.registry.release(character)
+            self.close_connection = True
 
 
-def run_server(preferred_port: int = 80, host: str = "0.0.0.0"):
+def run_server(preferred_port: int = 80, host: str = "0.0.0.0", write_behind: bool = False, flush_interval: float = 2.0, flush_threshold: int = 20, backups: int = 0, journal: bool = False, checkpoint_every: int = 200, shared_strings: bool = False, server: str = "threading", max_characters: int = 8, memory_budget: int = 256):
+    if AppHandler.registry is None:
+        AppHandler.registry = StoreRegistry(
+            ROOT,
+            max_stores=max_characters,
+            memory_budget=memory_budget * 1024 * 1024,
+            write_behind=write_behind,
+            flush_interval=flush_interval,
+            flush_threshold=flush_threshold,
+            backups=backups,
+            journal=journal,
+            checkpoint_every=checkpoint_every,
+            shared_strings=shared_strings,
+        )
+    if AppHandler.assets is None:
+        AppHandler.assets = StaticAssets(ROOT, thumbnails=AppHandler.registry.catalog.thumbnails)
 
     tried = []
     for port in [preferred_port, 80, 8000, 8080, 5000, 8001, 8888]:
@@ -56,26 +123,49 @@ def run_server(preferred_port: int = 80, host: str = "0.0.0.0"):
             continue
         tried.append(port)
         try:
-            server = ThreadingHTTPServer((host, port), AppHandler)
-            ip = "127.0.0.1"
-            try:
-                ip = socket.gethostbyname(socket.gethostname())
-            except Exception:
-                pass
-            if port == 80:
-                print(f"Serveur démarré sur http://localhost  | réseau: http://{ip}")
-            else:
-                print(f"Serveur démarré sur http://localhost:{port}  | réseau: http://{ip}:{port}")
-            server.serve_forever()
-            return
+            listener = socket.create_server((host, port)) if server == "asyncio" else ThreadingHTTPServer((host, port), AppHandler)
         except OSError:
             continue
+        ip = "127.0.0.1"
+        try:
+            ip = socket.gethostbyname(socket.gethostname())
+        except Exception:
+            pass
+        if port == 80:
+            print(f"Serveur démarré sur http://localhost  | réseau: http://{ip}")
+        else:
+            print(f"Serveur démarré sur http://localhost:{port}  | réseau: http://{ip}:{port}")
+        previous = signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            if server == "asyncio":
+                asyncio.run(serve(AppHandler.registry, AppHandler.assets, listener))
+            else:
+                listener.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if server == "asyncio":
+                listener.close()
+            else:
+                listener.server_close()
+            AppHandler.registry.close()
+            signal.signal(signal.SIGTERM, previous)
+        return
     raise OSError("Impossible de démarrer le serveur: ports 80/8000/8080/5000/8001/8888 indisponibles")
 
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fiche de personnage interactive")
     parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "80")), help="Port HTTP (80 par défaut)")
     parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"), help="Interface réseau")
+    parser.add_argument("--write-behind", action="store_true", default=os.getenv("WRITE_BEHIND", "") not in {"", "0"}, help="Sauvegarde différée des fichiers Excel")
+    parser.add_argument("--flush-interval", type=float, default=float(os.getenv("FLUSH_INTERVAL", "2")), help="Délai max (s) avant sauvegarde différée")
+    parser.add_argument("--flush-threshold", type=int, default=int(os.getenv("FLUSH_THRESHOLD", "20")), help="Nombre d'actions déclenchant une sauvegarde différée")
+    parser.add_argument("--backups", type=int, default=int(os.getenv("BACKUPS", "0")), help="Nombre de copies de sauvegarde (.bakN) conservées par classeur")
+    parser.add_argument("--journal", action="store_true", default=os.getenv("JOURNAL", "") not in {"", "0"}, help="Journal d'actions (journal.jsonl) avec points de contrôle Excel périodiques")
+    parser.add_argument("--checkpoint-every", type=int, default=int(os.getenv("CHECKPOINT_EVERY", "200")), help="Nombre d'actions journalisées entre deux points de contrôle")
+    parser.add_argument("--shared-strings", action="store_true", default=os.getenv("SHARED_STRINGS", "") not in {"", "0"}, help="Écrire les textes dans une table sharedStrings.xml dédupliquée")
+    parser.add_argument("--server", choices=["threading", "asyncio"], default=os.getenv("SERVER", "threading"), help="Serveur HTTP: un thread par connexion (threading) ou boucle asyncio unique")
+    parser.add_argument("--max-characters", type=int, default=int(os.getenv("MAX_CHARACTERS", "8")), help="Nombre max de personnages gardés en mémoire (personnages/<nom>/)")
+    parser.add_argument("--memory-budget", type=int, default=int(os.getenv("MEMORY_BUDGET", "256")), help="Budget mémoire approximatif (Mo) des personnages chargés")
     args = parser.parse_args()
-    run_server(args.port, args.host)
+    run_server(args.port, args.host, args.write_behind, args.flush_interval, args.flush_threshold, args.backups, args.journal, args.checkpoint_every, args.shared_strings, args.server, args.max_characters, args.memory_budget)
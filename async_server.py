@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+from api import EVENTS_HEARTBEAT, SSE_HEADERS, SSE_PING, Asset, Response, StaticAssets, api_get, api_post, content_length, invalid_length, json_response, nonblocking_get, route_character, sse_message, unknown_character
+from registry import StoreRegistry
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 4 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 75.0
+
+
+class _LoopQueue(queue.Queue):
+    def __init__(self, maxsize: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(maxsize)
+        self._loop = loop
+        self.ready = asyncio.Event()
+
+    def _put(self, item):
+        super()._put(item)
+        try:
+            self._loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            pass
+
+
+class AsyncAppServer:
+    def __init__(self, registry: StoreRegistry, assets: StaticAssets, workers: int = 4):
+        self.registry = registry
+        self.assets = assets
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="store")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while await self._handle_one(reader, writer):
+                pass
+        except (OSError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    async def _handle_one(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return False
+        request = self._parse(head)
+        if request is None:
+            await self._send(writer, "GET", json_response({"ok": False, "error": "Requête invalide"}, HTTPStatus.BAD_REQUEST), False)
+            return False
+        method, target, version, headers = request
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        if "transfer-encoding" in headers:
+            await self._send(writer, method, json_response({"ok": False, "error": "Content-Length requis"}, HTTPStatus.LENGTH_REQUIRED), False)
+            return False
+        length = content_length(headers.get("content-length"))
+        if length is None:
+            await self._send(writer, method, invalid_length(), False)
+            return False
+        if length > MAX_BODY_BYTES:
+            await self._send(writer, method, json_response({"ok": False, "error": "Requête trop volumineuse"}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE), False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+
+        character, target = route_character(target, headers.get("x-character", ""))
+        if method in {"GET", "HEAD"} and urlparse(target).path == "/api/events":
+            await self._stream_events(writer, character)
+            return False
+        try:
+            response = await self._route(method, character, target, headers, body)
+        except Exception as exc:
+            print(f"Erreur serveur: {exc!r}")
+            response = json_response({"ok": False, "error": "Erreur interne"}, HTTPStatus.INTERNAL_SERVER_ERROR)
+        if isinstance(response, tuple):
+            response, asset = response
+            if asset is not None:
+                await self._send_file(writer, method, response, asset, keep_alive)
+                return keep_alive
+        await self._send(writer, method, response, keep_alive)
+        return keep_alive
+
+    async def _route(self, method: str, character: str, target: str, headers: dict[str, str], body: bytes) -> Response | tuple[Response, Asset | None]:
+        loop = asyncio.get_running_loop()
+        if method == "POST":
+            return await loop.run_in_executor(self.executor, api_post, self.registry, character, target, body)
+        if method not in {"GET", "HEAD"}:
+            return json_response({"ok": False, "error": "Méthode non supportée"}, HTTPStatus.NOT_IMPLEMENTED)
+        if_none_match = headers.get("if-none-match", "")
+        response = nonblocking_get(self.registry, character, target, if_none_match)
+        if response is None:
+            response = await loop.run_in_executor(self.executor, api_get, self.registry, character, target, if_none_match)
+        if response is not None:
+            return response
+        return await loop.run_in_executor(self.executor, self.assets.response, target, headers.get("accept-encoding", ""), if_none_match)
+
+    @staticmethod
+    def _parse(head: bytes):
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    @staticmethod
+    def _head(status: HTTPStatus, headers: dict[str, str], keep_alive: bool, length: int | None) -> bytes:
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Date: {formatdate(usegmt=True)}", "Server: fiche-async"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send(self, writer: asyncio.StreamWriter, method: str, response: Response, keep_alive: bool):
+        length = None if response.status == HTTPStatus.NOT_MODIFIED else len(response.body)
+        writer.write(self._head(response.status, response.headers, keep_alive, length))
+        if method != "HEAD":
+            writer.write(response.body)
+        await writer.drain()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, method: str, response: Response, asset: Asset, keep_alive: bool):
+        with open(asset.path, "rb") as fh:
+            writer.write(self._head(response.status, response.headers, keep_alive, asset.size))
+            await writer.drain()
+            if method != "HEAD":
+                await asyncio.get_running_loop().sendfile(writer.transport, fh)
+
+    async def _stream_events(self, writer: asyncio.StreamWriter, character: str):
+        store = await asyncio.get_running_loop().run_in_executor(self.executor, self.registry.acquire, character)
+        if store is None:
+            await self._send(writer, "GET", unknown_character(), False)
+            return
+        events = store.events.subscribe(_LoopQueue(store.events.queue_size, asyncio.get_running_loop()))
+        try:
+            writer.write(self._head(HTTPStatus.OK, SSE_HEADERS, False, None))
+            writer.write(sse_message({"type": "version", "version": store.version, "incarnation": store.incarnation}))
+            await writer.drain()
+            while True:
+                try:
+                    await asyncio.wait_for(events.ready.wait(), EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(SSE_PING)
+                    await writer.drain()
+                    continue
+                events.ready.clear()
+                while True:
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is None:
+                        return
+                    writer.write(sse_message(event))
+                await writer.drain()
+        finally:
+            store.events.unsubscribe(events)
+            self.registry.release(character)
+
+
+async def serve(registry: StoreRegistry, assets: StaticAssets, listener: socket.socket):
+    app = AsyncAppServer(registry, assets)
+    server = await asyncio.start_server(app.handle, sock=listener, limit=MAX_HEADER_BYTES)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.executor.shutdown(wait=True)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.etree import ElementTree as ET
+from pathlib import Path
+
+from xlsx_store import NS_MAIN, CharacterAppStore, WorkbookData, XlsxMini, _ZipWriter
+
+ROOT = Path(__file__).parent
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+class _DeflateCounter:
+    WRITERS = (zipfile.ZipFile, _ZipWriter)
+
+    def __init__(self):
+        self.parts = 0
+        self.bytes = 0
+        self._originals = {cls: cls.writestr for cls in self.WRITERS}
+
+    def __enter__(self):
+        counter = self
+
+        def counting(original):
+            def writestr(zf, name, data, *args, **kwargs):
+                counter.parts += 1
+                counter.bytes += len(data.encode("utf-8") if isinstance(data, str) else data)
+                return original(zf, name, data, *args, **kwargs)
+            return writestr
+
+        for cls, original in self._originals.items():
+            cls.writestr = counting(original)
+        return self
+
+    def __exit__(self, *exc):
+        for cls, original in self._originals.items():
+            cls.writestr = original
+
+
+def bench_save(workbook: str, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / workbook
+        shutil.copy(ROOT / workbook, path)
+        data = XlsxMini.load(path)
+        XlsxMini.save(data, incremental=False)
+        sheet = next(name for name, rows in data.sheets.items() if rows)
+        row = data.sheets[sheet][0]
+        key = data.headers[sheet][0]
+        edits = iter(range(10**9))
+
+        def touch():
+            row[key] = f"bench {next(edits)}"
+
+        def full():
+            touch()
+            XlsxMini.save(data, incremental=False)
+
+        def incremental():
+            touch()
+            XlsxMini.save(data)
+
+        print(f"{workbook}: {len(data.sheets)} feuilles, modification d'une ligne de '{sheet}'")
+        for label, fn in [("complète", full), ("incrémentale", incremental)]:
+            ms = _timed(fn, repeat)
+            with _DeflateCounter() as deflated:
+                fn()
+            size = path.stat().st_size
+            print(f"  sauvegarde {label:<13} {ms:8.3f} ms/save  {deflated.parts:2d} parties recompressées ({deflated.bytes} octets XML)  fichier {size} octets")
+
+
+def bench_strings(repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        for workbook in ["caracteristique.xlsx", "inventaire.xlsx", "magasin.xlsx"]:
+            data = XlsxMini.load(ROOT / workbook)
+            data.path = Path(tmp) / workbook
+            print(workbook)
+            for label, shared in [("inlineStr", False), ("sharedStrings", True)]:
+                data.shared_strings = shared
+                ms = _timed(lambda: XlsxMini.save(data, incremental=False), repeat)
+                with zipfile.ZipFile(data.path) as zf:
+                    xml = sum(i.file_size for i in zf.infolist())
+                print(f"  {label:<14} {ms:7.3f} ms/save  XML {xml:6d} octets  fichier {data.path.stat().st_size:6d} octets")
+
+
+class _ReferenceCells:
+    @staticmethod
+    def row_values(row, shared: list[str]) -> list[str]:
+        cells = {}
+        for c in row.findall(f"{{{NS_MAIN}}}c"):
+            ref = c.attrib.get("r", "A1")
+            col = re.match(r"([A-Z]+)", ref).group(1)
+            idx = _ReferenceCells.col_to_idx(col)
+            t = c.attrib.get("t")
+            val = ""
+            v = c.find(f"{{{NS_MAIN}}}v")
+            if v is not None and v.text is not None:
+                val = shared[int(v.text)] if t == "s" else v.text
+            else:
+                isel = c.find(f"{{{NS_MAIN}}}is/{{{NS_MAIN}}}t")
+                if isel is not None and isel.text is not None:
+                    val = isel.text
+            cells[idx] = val
+        if not cells:
+            return []
+        max_idx = max(cells)
+        return [cells.get(i, "") for i in range(max_idx + 1)]
+
+    @staticmethod
+    def col_to_idx(col: str) -> int:
+        n = 0
+        for ch in col:
+            n = n * 26 + ord(ch) - 64
+        return n - 1
+
+    @staticmethod
+    def idx_to_col(idx: int) -> str:
+        idx += 1
+        out = ""
+        while idx:
+            idx, r = divmod(idx - 1, 26)
+            out = chr(65 + r) + out
+        return out
+
+    @staticmethod
+    def sheet_xml(headers: list[str], rows: list[dict]) -> str:
+        all_rows = [headers] + [[str(r.get(h, "")) for h in headers] for r in rows]
+        row_xml = []
+        for r_idx, vals in enumerate(all_rows, start=1):
+            cells = []
+            for c_idx, val in enumerate(vals):
+                if val == "":
+                    continue
+                ref = f"{_ReferenceCells.idx_to_col(c_idx)}{r_idx}"
+                if re.fullmatch(r"-?\d+(\.\d+)?", val):
+                    cells.append(f'<c r="{ref}"><v>{val}</v></c>')
+                else:
+                    safe = (
+                        val.replace("&", "&amp;")
+                        .replace("<", "&lt;")
+                        .replace(">", "&gt;")
+                    )
+                    cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{safe}</t></is></c>')
+            row_xml.append(f'<row r="{r_idx}">{"".join(cells)}</row>')
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f'<sheetData>{"".join(row_xml)}</sheetData></worksheet>'
+        )
+
+
+def bench_cells(rows: int, repeat: int):
+    source = XlsxMini.load(ROOT / "magasin.xlsx")
+    name = next(n for n, r in source.sheets.items() if r)
+    headers = source.headers[name]
+    sheet_rows = [{**source.sheets[name][i % len(source.sheets[name])], "nom de l'objet": f"objet {i}"} for i in range(rows)]
+    xml = XlsxMini._sheet_xml(headers, sheet_rows).encode("utf-8")
+    parsed = ET.fromstring(xml).findall(f"{{{NS_MAIN}}}sheetData/{{{NS_MAIN}}}row")
+    cells = sum(len(row) for row in parsed)
+    assert [_ReferenceCells.row_values(row, []) for row in parsed] == [XlsxMini._row_values(row, []) for row in parsed]
+    assert _ReferenceCells.sheet_xml(headers, sheet_rows) == XlsxMini._sheet_xml(headers, sheet_rows)
+    timings = [
+        ("lecture  _row_values", lambda: [_ReferenceCells.row_values(row, []) for row in parsed], lambda: [XlsxMini._row_values(row, []) for row in parsed]),
+        ("écriture _sheet_xml ", lambda: _ReferenceCells.sheet_xml(headers, sheet_rows), lambda: XlsxMini._sheet_xml(headers, sheet_rows)),
+    ]
+    print(f"feuille '{name}': {rows} lignes, {cells} cellules")
+    for label, reference, current in timings:
+        before = _timed(reference, repeat) * 1e6 / cells
+        after = _timed(current, repeat) * 1e6 / cells
+        print(f"  {label} référence {before:7.1f} ns/cellule, actuel {after:7.1f} ns/cellule (x{before / after:.1f})")
+
+
+def _load_dom(path: Path):
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if not info.filename.startswith("xl/worksheets/"):
+                continue
+            xml = ET.fromstring(zf.read(info.filename))
+            rows = xml.findall(f"{{{NS_MAIN}}}sheetData/{{{NS_MAIN}}}row")
+            header = XlsxMini._row_values(rows[0], []) if rows else []
+            for row in rows[1:]:
+                vals = XlsxMini._row_values(row, [])
+                {header[i]: (vals[i] if i < len(vals) else "") for i in range(len(header)) if header[i] != ""}
+
+
+def _peak_kib(fn) -> float:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def bench_load(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "catalogue.xlsx"
+        source = XlsxMini.load(ROOT / "magasin.xlsx")
+        sheets = {}
+        for name, sheet_rows in source.sheets.items():
+            sheets[name] = [
+                {**sheet_rows[i % len(sheet_rows)], "nom de l'objet": f"objet {name} {i}"} for i in range(rows)
+            ] if sheet_rows else []
+        XlsxMini.save(WorkbookData(path=path, sheets=sheets, headers=source.headers), incremental=False)
+        print(f"catalogue synthétique: {len(sheets)} feuilles x {rows} lignes, {path.stat().st_size} octets")
+        for label, fn in [("arbre complet", lambda: _load_dom(path)), ("iterparse", lambda: XlsxMini.load(path))]:
+            elapsed = _timed(fn, 3)
+            peak = _peak_kib(fn)
+            print(f"  {label:<14} {elapsed:8.1f} ms  pic mémoire {peak:9.0f} Kio")
+
+
+def bench_replay(journal: Path):
+    with open(journal, encoding="utf-8") as fh:
+        entries = [json.loads(line) for line in fh if line.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for name in ["caracteristique.xlsx", "inventaire.xlsx", "magasin.xlsx"]:
+            shutil.copy(ROOT / name, root / name)
+        (root / "image").symlink_to(ROOT / "image")
+        store = CharacterAppStore(root, write_behind=True, flush_interval=3600, flush_threshold=10**9)
+        start = time.perf_counter()
+        for entry in entries:
+            store._replay_ids = list(entry.get("ids", []))
+            if "actions" in entry:
+                store.apply_actions(entry["actions"])
+            else:
+                store.apply_action(entry.get("action", {}))
+        elapsed = time.perf_counter() - start
+        store.close()
+    per_action = elapsed / len(entries) * 1000 if entries else 0
+    print(f"{journal.name}: {len(entries)} actions rejouées en {elapsed * 1000:.1f} ms ({per_action:.3f} ms/action)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de la fiche de personnage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    save = sub.add_parser("save", help="Sauvegarde complète vs incrémentale")
+    save.add_argument("--workbook", default="magasin.xlsx")
+    save.add_argument("--repeat", type=int, default=200)
+    strings = sub.add_parser("strings", help="Écriture inlineStr vs table de chaînes partagées")
+    strings.add_argument("--repeat", type=int, default=200)
+    cells = sub.add_parser("cells", help="Coût par cellule de la lecture et de l'écriture")
+    cells.add_argument("--rows", type=int, default=2000)
+    cells.add_argument("--repeat", type=int, default=20)
+    load = sub.add_parser("load", help="Chargement streaming d'un grand catalogue")
+    load.add_argument("--rows", type=int, default=5000)
+    replay = sub.add_parser("replay", help="Rejoue un journal d'actions sur une copie des classeurs")
+    replay.add_argument("journal", type=Path)
+    args = parser.parse_args()
+    if args.command == "save":
+        bench_save(args.workbook, args.repeat)
+    elif args.command == "strings":
+        bench_strings(args.repeat)
+    elif args.command == "cells":
+        bench_cells(args.rows, args.repeat)
+    elif args.command == "load":
+        bench_load(args.rows)
+    elif args.command == "replay":
+        bench_replay(args.journal)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+
+class StateEvents:
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = max(1, queue_size)
+        self.dropped = 0
+        self.closed = False
+        self._subscribers: set[queue.Queue] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, events: queue.Queue | None = None) -> queue.Queue:
+        events = events if events is not None else queue.Queue(self.queue_size)
+        with self._lock:
+            if self.closed:
+                events.put_nowait(None)
+            else:
+                self._subscribers.add(events)
+        return events
+
+    def unsubscribe(self, events: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(events)
+
+    def publish(self, event):
+        with self._lock:
+            for events in self._subscribers:
+                try:
+                    events.put_nowait(event)
+                except queue.Full:
+                    self.dropped += 1
+                    self._reset(events, {"type": "resync", "incarnation": event.get("incarnation"), "version": event["version"]})
+
+    @staticmethod
+    def _reset(events: queue.Queue, event):
+        while True:
+            try:
+                events.get_nowait()
+            except queue.Empty:
+                break
+        events.put_nowait(event)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            for events in self._subscribers:
+                self._reset(events, None)
+            self._subscribers.clear()
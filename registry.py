@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from xlsx_store import CharacterAppStore, ShopCatalog, SnapshotCache
+
+DEFAULT_CHARACTER = "default"
+CHARACTERS_DIR = "personnages"
+CHARACTER_FILES = ("caracteristique.xlsx", "inventaire.xlsx")
+_CHARACTER_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class StoreRegistry:
+    def __init__(self, root: Path, max_stores: int = 8, memory_budget: int = 256 * 1024 * 1024, **store_options):
+        self.root = root
+        self.max_stores = max(1, max_stores)
+        self.memory_budget = memory_budget
+        self.store_options = store_options
+        snapshots = SnapshotCache(root / ".cache" / "snapshots") if store_options.get("snapshot", True) else None
+        self.catalog = ShopCatalog(root, snapshots)
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+        self._stores: OrderedDict[str, CharacterAppStore] = OrderedDict()
+        self._sizes: dict[str, tuple[int, int]] = {}
+        self._leases: dict[str, int] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, character: str) -> Path | None:
+        if character in {"", DEFAULT_CHARACTER}:
+            return self.root
+        if not _CHARACTER_RE.fullmatch(character):
+            return None
+        folder = self.root / CHARACTERS_DIR / character
+        return folder if all((folder / name).is_file() for name in CHARACTER_FILES) else None
+
+    def characters(self) -> list[str]:
+        folder = self.root / CHARACTERS_DIR
+        names = sorted(p.name for p in folder.iterdir() if p.is_dir() and self.path_for(p.name)) if folder.is_dir() else []
+        return [DEFAULT_CHARACTER, *names]
+
+    def is_loaded(self, character: str) -> bool:
+        return (character or DEFAULT_CHARACTER) in self._stores
+
+    def _lease_loaded(self, character: str) -> CharacterAppStore | None:
+        store = self._stores.get(character)
+        if store is not None:
+            self._stores.move_to_end(character)
+            self._leases[character] = self._leases.get(character, 0) + 1
+            self.stats["hits"] += 1
+        return store
+
+    def acquire(self, character: str) -> CharacterAppStore | None:
+        character = character or DEFAULT_CHARACTER
+        with self._lock:
+            store = self._lease_loaded(character)
+            if store is not None:
+                return store
+        path = self.path_for(character)
+        if path is None:
+            return None
+        with self._lock:
+            loading = self._locks.setdefault(character, threading.Lock())
+        with loading:
+            with self._lock:
+                store = self._lease_loaded(character)
+                if store is not None:
+                    return store
+            store = CharacterAppStore(path, catalog=self.catalog, **self.store_options)
+            with self._lock:
+                self._stores[character] = store
+                self._leases[character] = 1
+                self.stats["loads"] += 1
+        self._shrink()
+        return store
+
+    def try_acquire(self, character: str) -> CharacterAppStore | None:
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._lease_loaded(character or DEFAULT_CHARACTER)
+        finally:
+            self._lock.release()
+
+    def release(self, character: str):
+        with self._lock:
+            self._leases[character or DEFAULT_CHARACTER] -= 1
+
+    @contextmanager
+    def lease(self, character: str):
+        store = self.acquire(character)
+        try:
+            yield store
+        finally:
+            if store is not None:
+                self.release(character)
+
+    @contextmanager
+    def try_lease(self, character: str):
+        store = self.try_acquire(character)
+        try:
+            yield store
+        finally:
+            if store is not None:
+                self.release(character)
+
+    def memory(self) -> int:
+        return sum(size for _, size in self._sizes.values())
+
+    def _measure(self):
+        with self._lock:
+            stale = [(name, store) for name, store in self._stores.items() if self._sizes.get(name, (None,))[0] != store.version]
+        measured = [(name, store, store.version, store.memory_estimate()) for name, store in stale]
+        with self._lock:
+            for name, store, version, size in measured:
+                if self._stores.get(name) is store:
+                    self._sizes[name] = (version, size)
+
+    def _shrink(self):
+        self._measure()
+        with self._lock:
+            victims = []
+            total = self.memory()
+            for name in list(self._stores):
+                if len(self._stores) <= self.max_stores and total <= self.memory_budget:
+                    break
+                if self._leases.get(name) or not self._locks.setdefault(name, threading.Lock()).acquire(blocking=False):
+                    continue
+                victims.append((name, self._stores.pop(name)))
+                total -= self._sizes.pop(name, (None, 0))[1]
+        for name, store in victims:
+            try:
+                store.close()
+                with self._lock:
+                    self.stats["evictions"] += 1
+            except Exception as exc:
+                print(f"Éviction impossible pour {name}: {exc}")
+                with self._lock:
+                    self._stores[name] = store
+            finally:
+                self._locks[name].release()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": list(self._stores),
+                "leases": {name: count for name, count in self._leases.items() if count},
+                "memory": self.memory(),
+                "memory_budget": self.memory_budget,
+                "max_stores": self.max_stores,
+                **self.stats,
+            }
+
+    def close(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+            self._sizes.clear()
+        for store in stores:
+            store.close()
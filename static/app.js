@@ -2,6 +2,10 @@ let state = null;
 let modalInventoryId = null;
 let modalShopRef = null;
 let assignTypePending = null;
+let shopCache = {};
+const shopLoading = {};
+let activeShopSheet = null;
+const API_BASE = (location.pathname.match(/^\/c\/[^/]+/) || [''])[0];
 
 const money = (v) => Number(v || 0).toFixed(2);
 const clean = (v) => (v === undefined || v === null ? '' : String(v));
@@ -18,11 +22,46 @@ const itemActions = new Set(['toggle_equip', 'assign_type', 'sell']);
 
 const escapeHtml = (v) => clean(v).replaceAll('&', '&amp;').replaceAll('<', '&lt;').replaceAll('>', '&gt;').replaceAll('"', '&quot;');
 
+const applyPatch = (doc, ops) => {
+  ops.forEach(op => {
+    const keys = op.path.split('/').slice(1).map(k => k.replaceAll('~1', '/').replaceAll('~0', '~'));
+    const last = keys.pop();
+    const parent = keys.reduce((node, key) => node[key], doc);
+    if (Array.isArray(parent)) {
+      if (op.op === 'remove') parent.splice(Number(last), 1);
+      else if (op.op === 'add') parent.splice(Number(last), 0, op.value);
+      else parent[Number(last)] = op.value;
+    } else if (op.op === 'remove') delete parent[last];
+    else parent[last] = op.value;
+  });
+  return doc;
+};
+
+const refreshState = async () => {
+  const res = await fetch(`${API_BASE}/api/state`);
+  state = await res.json();
+};
+
+const applyResponse = async (json, base, incarnation) => {
+  if (json.patch) {
+    if (state.version === base && state.incarnation === incarnation && json.incarnation === incarnation) {
+      applyPatch(state, json.patch);
+      state.version = json.version;
+    } else if (json.incarnation !== state.incarnation || json.version > state.version) {
+      await refreshState();
+    }
+  } else if (json.state) {
+    state = { ...state, ...json.state };
+  }
+};
+
 const apiAction = async (payload) => {
-  const res = await fetch('/api/action', {
+  const base = state?.version;
+  const incarnation = state?.incarnation;
+  const res = await fetch(`${API_BASE}/api/action`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(payload)
+    body: JSON.stringify({ ...payload, base_version: base, incarnation })
   });
   const json = await res.json();
 
@@ -36,7 +75,7 @@ const apiAction = async (payload) => {
     showAlertModal(json.error || "Impossible d'acheter cette compétence.");
   }
 
-  state = json.state;
+  await applyResponse(json, base, incarnation);
   render();
 
   if (modalInventoryId && itemActions.has(payload.action) && payload.source !== 'inline') {
@@ -47,11 +86,30 @@ const apiAction = async (payload) => {
   return json;
 };
 
+const subscribeEvents = () => {
+  if (!window.EventSource) return;
+  const source = new EventSource(`${API_BASE}/api/events`);
+  const onEvent = async (e) => {
+    const data = JSON.parse(e.data);
+    if (!state) return;
+    const sameIncarnation = data.incarnation === state.incarnation;
+    if (sameIncarnation && (data.version === state.version || (data.type === 'patch' && data.version < state.version))) return;
+    if (sameIncarnation && data.type === 'patch' && data.patch && data.base === state.version) {
+      applyPatch(state, data.patch);
+      state.version = data.version;
+    } else {
+      await refreshState();
+    }
+    render();
+  };
+  ['version', 'patch', 'resync'].forEach(type => source.addEventListener(type, onEvent));
+};
+
 const init = async () => {
-  const res = await fetch('/api/state');
-  state = await res.json();
+  await refreshState();
   bindTabs();
   render();
+  subscribeEvents();
 };
 
 const bindTabs = () => {
@@ -61,10 +119,23 @@ const bindTabs = () => {
       document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
       btn.classList.add('active');
       document.getElementById(btn.dataset.tab).classList.add('active');
+      if (btn.dataset.tab === 'shop') renderShop();
     };
   });
 };
 
+const loadShopSheet = (sheet) => {
+  if (shopCache[sheet]) return Promise.resolve(shopCache[sheet]);
+  shopLoading[sheet] = shopLoading[sheet] || fetch(`${API_BASE}/api/shop/${encodeURIComponent(sheet)}?v=${state.shop_catalog}`)
+    .then(res => (res.ok ? res.json() : []))
+    .then(items => {
+      shopCache[sheet] = items;
+      delete shopLoading[sheet];
+      return items;
+    });
+  return shopLoading[sheet];
+};
+
 const render = () => {
   renderStats();
   renderInventory();
@@ -122,7 +193,7 @@ const renderInventory = () => {
   <div class="grid">
     <div class="panel">
       <h2>Sac à dos</h2>
-      <div class="row"><strong>Crédits:</strong> <input type='number' step='0.01' value='${inv.credits}' onchange='updateCredits(this.value)' style='width:140px'> | <strong>Poids:</strong> ${money(inv.bag_weight)}kg / ${money(inv.max_carry)}kg ${inv.overweight ? `<span class=\"warn\">⚠ surcharge: -${inv.dex_penalty} dex</span>` : ''}</div>
+      <div class="row"><strong>Crédits:</strong> <input type='number' step='0.01' value='${inv.credits}' onchange='updateCredits(this.value)' style='width:140px'> | <strong>Poids:</strong> ${money(inv.bag_weight)}kg / ${money(inv.max_carry)}kg | <strong>Valeur du sac:</strong> ${money(inv.bag_value)} | <strong>Coffre:</strong> ${money(inv.chest_value)} ${inv.overweight ? `<span class=\"warn\">⚠ surcharge: -${inv.dex_penalty} dex</span>` : ''}</div>
       <div class="row"><button onclick="sortBag('alpha')">A-Z</button><button onclick="sortBag('prix')">Prix</button><button onclick="sortBag('poids')">Poids</button></div>
       <div class="table-wrap"><table>
         <tr><th>Nom (cliquable)</th><th>Valeur totale</th><th>Poids total</th><th>Quantité</th><th>Type</th><th>Action</th></tr>
@@ -136,7 +207,7 @@ const renderInventory = () => {
     </div>
 
     <div class="panel">
-      <h2>Coffre</h2>
+      <div class="row"><h2>Coffre</h2><button onclick="transferAll('coffre', 'sac à dos')">Tout vers le sac</button><button onclick="transferAll('sac à dos', 'coffre')">Tout ranger au coffre</button></div>
       <div class="table-wrap"><table>
         <tr><th>Nom (cliquable)</th><th>Valeur totale</th><th>Poids total</th><th>Quantité</th><th>Type</th><th>Action</th></tr>
         ${inv.chest.map(i => itemRow(i, 'coffre')).join('')}
@@ -158,20 +229,39 @@ const renderInventory = () => {
 };
 
 const renderShop = () => {
-  const sections = Object.entries(state.shop).map(([sheet, items]) => `
+  const sheets = state.shop_sheets || [];
+  if (!sheets.includes(activeShopSheet)) activeShopSheet = sheets[0] || null;
+  const container = document.getElementById('shop');
+  if (!activeShopSheet) {
+    container.innerHTML = '<div class="panel"><p>Aucun objet en vente.</p></div>';
+    return;
+  }
+  const subTabs = `<div class="row subtabs">${sheets.map(sheet => `<button class="${sheet === activeShopSheet ? 'active' : ''}" onclick="selectShopSheet('${encodeURIComponent(sheet)}')">${sheet}</button>`).join('')}</div>`;
+  const sheet = activeShopSheet;
+  const items = shopCache[sheet];
+  if (!items) {
+    container.innerHTML = `${subTabs}<div class="panel"><p>Chargement…</p></div>`;
+    if (container.classList.contains('active')) loadShopSheet(sheet).then(renderShop);
+    return;
+  }
+  container.innerHTML = `${subTabs}
     <div class="panel"><div class="row"><h3>${sheet}</h3><span class="credit-badge">💳 Crédits: ${money(state.inventory.credits)}</span></div>
       <div class="table-wrap"><table>
         <tr><th>Objet</th><th>Image</th><th>Modificateur</th><th>Prix</th><th>Poids</th><th>Description</th><th>Achat</th></tr>
         ${items.map(i => {
           const name = i["nom de l'objet"] || '';
-          const imgSrc = resolveImageSrc(i['resolved_image'] || i.image);
+          const imgSrc = resolveImageSrc(i['resolved_thumbnail'] || i['resolved_image'] || i.image);
           const img = imgSrc ? `<img class='shop-thumb' src='${imgSrc}' alt='${name}'>` : '-';
           const mod = i['resolved_hit_modifier'] || '-';
           return `<tr class="clickable" onclick="openShopModal('${sheet}','${encodeURIComponent(name)}')"><td>${name}</td><td>${img}</td><td>${mod}</td><td>${money(i['prix unitaire (crédit)'])}</td><td>${money(i['poid unitaire(kg)'])}</td><td>${i.description || ''}</td><td><input id="buy-${sheet}-${name.replace(/\s+/g,'_')}" type="number" value="1" onclick="event.stopPropagation()" style="width:70px"><button onclick="event.stopPropagation(); buyEncoded('${sheet}','${encodeURIComponent(name)}')">Acheter</button></td></tr>`;
         }).join('')}
       </table></div>
-    </div>`).join('');
-  document.getElementById('shop').innerHTML = sections;
+    </div>`;
+};
+
+window.selectShopSheet = (encodedSheet) => {
+  activeShopSheet = decodeURIComponent(encodedSheet);
+  renderShop();
 };
 
 const skillMapFromBranch = (branch) => {
@@ -224,6 +314,7 @@ window.updateHp = (value) => apiAction({ action: 'update_hp', value });
 window.toggleSkill = (name, specialized) => apiAction({ action: 'toggle_skill', name, specialized });
 window.toggleExpertise = (name, expertise) => apiAction({ action: 'toggle_expertise', name, expertise });
 window.sortBag = (key) => apiAction({ action: 'sort', key, source: 'sac à dos' });
+window.transferAll = (from, to) => apiAction({ action: 'transfer_items', from, to });
 window.transferQty = (from, to, id) => apiAction({ action: 'transfer_item', from, to, id, qty: document.getElementById(`move-${id}`).value });
 window.quickUpdate = (id, key, value) => apiAction({ action: 'update_item', id, [key]: value, source: 'inline' });
 window.updateCredits = (credits) => apiAction({ action: 'update_credits', credits });
@@ -358,7 +449,7 @@ window.toggleEquipFromModal = async () => { const it = getInventoryItem(modalInv
 
 window.openShopModal = (sheet, encodedName) => {
   const name = decodeURIComponent(encodedName);
-  const item = (state.shop[sheet] || []).find(x => (x["nom de l'objet"] || '') === name);
+  const item = (shopCache[sheet] || []).find(x => (x["nom de l'objet"] || '') === name);
   if (!item) return;
   modalShopRef = { sheet, name, price: Number(item['prix unitaire (crédit)'] || 0) };
   modalInventoryId = null;
@@ -0,0 +1,26 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+WORKBOOKS = ("caracteristique.xlsx", "inventaire.xlsx", "magasin.xlsx")
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    for name in WORKBOOKS:
+        shutil.copy(ROOT / name, tmp_path / name)
+    return tmp_path
+
+
+@pytest.fixture
+def store(workdir: Path):
+    from xlsx_store import CharacterAppStore
+
+    store = CharacterAppStore(workdir, snapshot=False)
+    yield store
+    store.close()
@@ -0,0 +1,40 @@
+import pytest
+
+from xlsx_store import CharacterAppStore
+
+
+def test_batch_rolls_back_when_an_action_raises(workdir):
+    store = CharacterAppStore(workdir, snapshot=False, journal=True)
+    events = store.events.subscribe()
+    version, credits, state = store.version, store._credits(), store.build_state()
+    section_versions = dict(store._section_versions)
+
+    with pytest.raises(KeyError):
+        store.apply_actions([
+            {"action": "update_credits", "credits": 12345},
+            {"action": "transfer_item", "from": "sac à dos", "to": "coffre"},
+        ])
+
+    assert store.version == version
+    assert store._section_versions == section_versions
+    assert store._credits() == credits
+    assert store.build_state() == state
+    assert not store._dirty
+    assert store._journal.pending() == []
+
+    response = store.apply_action({"action": "update_credits", "credits": 7, "base_version": version, "incarnation": store.incarnation})
+    assert response["patch"] is not None
+    assert events.get_nowait()["patch"] is not None
+    assert store.build_state()["inventory"]["credits"] == 7
+    store.close()
+
+
+def test_batch_rolls_back_on_rejected_action(store):
+    version, credits = store.version, store._credits()
+    response = store.apply_actions([
+        {"action": "update_credits", "credits": 1},
+        {"action": "buy_skill_tree", "id": "inconnue"},
+    ])
+    assert response == {"ok": False, "error": "Compétence introuvable.", "index": 1}
+    assert store.version == version
+    assert store._credits() == credits
@@ -0,0 +1,29 @@
+from http import HTTPStatus
+
+from api import api_get, content_length, nonblocking_get
+from registry import StoreRegistry
+
+
+def test_nonblocking_get_only_serves_loaded_state(workdir):
+    registry = StoreRegistry(workdir, snapshot=False)
+    assert nonblocking_get(registry, "default", "/api/state") is None
+    assert not registry.is_loaded("default")
+    blocking = api_get(registry, "default", "/api/state")
+    response = nonblocking_get(registry, "default", "/api/state")
+    assert response.status == HTTPStatus.OK
+    assert response.body == blocking.body
+    assert nonblocking_get(registry, "default", "/api/state", response.headers["ETag"]).status == HTTPStatus.NOT_MODIFIED
+    assert nonblocking_get(registry, "default", "/api/state/inventory").status == HTTPStatus.OK
+    assert nonblocking_get(registry, "default", "/api/state/inconnue").status == HTTPStatus.NOT_FOUND
+    assert nonblocking_get(registry, "default", "/api/state/shop") is None
+    assert registry.metrics()["leases"] == {}
+    registry.close()
+
+
+def test_content_length_validation():
+    assert content_length(None) == 0
+    assert content_length("") == 0
+    assert content_length(" 12 ") == 12
+    assert content_length("-1") is None
+    assert content_length("abc") is None
+    assert content_length("²") is None
@@ -0,0 +1,52 @@
+import queue
+import threading
+
+from events import StateEvents
+
+
+def _drain(events: queue.Queue) -> list:
+    received = []
+    while True:
+        try:
+            received.append(events.get_nowait())
+        except queue.Empty:
+            return received
+
+
+def test_overflow_replaces_backlog_with_resync():
+    hub = StateEvents(queue_size=2)
+    events = hub.subscribe()
+    for version in range(1, 4):
+        hub.publish({"type": "patch", "incarnation": "a1", "version": version})
+    assert _drain(events) == [{"type": "resync", "incarnation": "a1", "version": 3}]
+    assert hub.dropped == 1
+
+
+def test_close_always_delivers_the_sentinel():
+    for _ in range(50):
+        hub = StateEvents(queue_size=1)
+        events = hub.subscribe()
+        stop = threading.Event()
+
+        def publisher():
+            version = 0
+            while not stop.is_set():
+                version += 1
+                hub.publish({"type": "patch", "version": version})
+
+        threads = [threading.Thread(target=publisher) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        hub.close()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        assert _drain(events)[-1] is None
+
+
+def test_subscribe_after_close_ends_immediately():
+    hub = StateEvents()
+    hub.close()
+    events = hub.subscribe()
+    assert _drain(events) == [None]
+    assert len(hub) == 0
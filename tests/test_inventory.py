@@ -0,0 +1,135 @@
+import random
+from fractions import Fraction
+
+import pytest
+
+from xlsx_store import CharacterAppStore, InventoryIndex
+
+BUCKETS = InventoryIndex.BUCKETS
+NAMES = ["épée", "Épée ", "arc", "casque", "pain", "corde"]
+
+
+def _index_state(index: InventoryIndex) -> tuple:
+    return (
+        dict(index.positions),
+        dict(index.equipped),
+        {sheet: {key: sorted(ids) for key, ids in stacks.items()} for sheet, stacks in index.stacks.items()},
+        index.ac_bonus,
+        [(index.weight(sheet), index.value(sheet)) for sheet in BUCKETS],
+    )
+
+
+def _exact_sum(rows: list[dict], field: str) -> float:
+    return float(sum(Fraction(CharacterAppStore._to_float(r.get(field, 0))) for r in rows if r.get("type") != "currency"))
+
+
+def _persisted(section: dict) -> dict:
+    return {
+        key: [{k: v for k, v in row.items() if v != ""} for row in value] if isinstance(value, list) else value
+        for key, value in section.items()
+    }
+
+
+def _check(store: CharacterAppStore):
+    index = store._items
+    assert _index_state(index) == _index_state(InventoryIndex(store.inv))
+    assert index.currency_row() is next((i for i in store.inv.sheets["sac à dos"] if i.get("type") == "currency"), None)
+
+    for sheet in BUCKETS:
+        rows = store.inv.sheets[sheet]
+        assert len({r["id"] for r in rows}) == len(rows)
+        for item in rows:
+            q = store._to_float(item.get("Quantité", 1), 1)
+            assert item["Poid (kg)"] == str(round(q * store._to_float(item.get("poid unitaire (kg)", 0), 0), 2))
+            if item.get("type") != "currency":
+                assert item["Valeur (en crédit)"] == str(round(q * store._to_float(item.get("Prix unitaire (en crédit)", 0), 0), 2))
+        assert index.weight(sheet) == _exact_sum(rows, "Poid (kg)")
+        assert index.value(sheet) == _exact_sum(rows, "Valeur (en crédit)")
+
+    bag = store.inv.sheets["sac à dos"]
+    _, effective, _, _ = store._stats_context()
+    assert store.inv.sheets["armes"] == [
+        {"Armes": i.get("Objet", ""), "Range (ft)": i.get("Range (ft)", ""), "Hit": store._weapon_hit_display(i, effective), "Damage": i.get("Damage", ""), "description": i.get("description", "")}
+        for i in bag if i.get("type") == "arme"
+    ]
+    equipment = [i for i in bag if i.get("type") == "equipement"]
+    assert store.inv.sheets["equipement"] == [
+        {"Equipement": i.get("Objet", ""), "bonus Armor class": i.get("bonus Armor class", "0"), "effet(optionel)": i.get("effet(optionel)", "ho le nul il a pas d'effets"), "description": i.get("description", "")}
+        for i in equipment
+    ]
+    assert index.ac_bonus == sum(int(store._to_float(i.get("bonus Armor class", "0"), 0)) for i in equipment if i.get("equiped") == "1")
+    for typ, count in index.equipped.items():
+        assert count == sum(1 for i in bag if i.get("type") == typ and i.get("equiped") == "1")
+
+
+class _Actions:
+    def __init__(self, store: CharacterAppStore, rng: random.Random):
+        self.store = store
+        self.rng = rng
+        self.shop = [(sheet, row["nom de l'objet"]) for sheet in store.catalog.names for row in store.catalog.sheet(sheet).rows]
+
+    def _id(self) -> str:
+        ids = [i["id"] for sheet in BUCKETS for i in self.store.inv.sheets[sheet]]
+        return self.rng.choice(ids + ["inconnu"])
+
+    def _item(self) -> dict:
+        rng = self.rng
+        return {
+            "Objet": rng.choice(NAMES),
+            "Prix unitaire (en crédit)": str(rng.randint(1, 50)),
+            "Quantité": str(rng.randint(1, 3)),
+            "poid unitaire (kg)": rng.choice(["1", "0.1", "0.3", "2.5"]),
+            "bonus Armor class": rng.choice(["", "1", "2"]),
+            "Hit": rng.choice(["", "2", "dex"]),
+            "type": rng.choice(["arme", "equipement", "item", None]),
+            "equiped": rng.choice(["0", "1"]),
+        }
+
+    def next(self) -> dict:
+        rng = self.rng
+        src, dst = rng.sample(BUCKETS, 2)
+        choices = [
+            lambda: {"action": "add_item", "item": self._item()},
+            lambda: {"action": "add_items", "items": [self._item() for _ in range(rng.randint(1, 5))]},
+            lambda: {"action": "transfer_item", "from": src, "to": dst, "id": self._id(), "qty": rng.randint(1, 3)},
+            lambda: {"action": "transfer_items", "from": src, "to": dst},
+            lambda: {"action": "transfer_items", "from": src, "to": dst, "ids": [self._id() for _ in range(3)]},
+            lambda: {"action": "assign_type", "id": self._id(), "type": rng.choice(["arme", "equipement", "item"])},
+            lambda: {"action": "toggle_equip", "id": self._id(), "equiped": rng.random() < 0.7},
+            lambda: {"action": "sell", "id": self._id(), "qty": rng.randint(1, 3)},
+            lambda: {"action": "update_item", "id": self._id(), rng.choice(["type", "Quantité", "poid unitaire (kg)", "bonus Armor class", "Hit Stat"]): rng.choice(["arme", "equipement", "2", "0.2", "dex", "force"])},
+            lambda: {"action": "sort", "key": rng.choice(["alpha", "prix", "poids"]), "source": src},
+            lambda: {"action": "buy", "sheet": rng.choice(self.shop)[0], "name": rng.choice(self.shop)[1], "qty": rng.randint(1, 2)},
+            lambda: {"action": "update_credits", "credits": rng.randint(0, 5000)},
+            lambda: {"action": "update_stat", "name": rng.choice(["Force", "Dextérité"]), "score": rng.randint(3, 20)},
+        ]
+        return rng.choice(choices)()
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_incremental_inventory_matches_a_full_recompute(workdir, seed):
+    store = CharacterAppStore(workdir, snapshot=False, write_behind=True, flush_interval=3600, flush_threshold=10**9)
+    actions = _Actions(store, random.Random(seed))
+    for _ in range(120):
+        if actions.rng.random() < 0.15:
+            batch = [actions.next() for _ in range(actions.rng.randint(1, 4))]
+            if actions.rng.random() < 0.5:
+                batch.append({"action": "buy_skill_tree", "id": "inconnue"})
+            store.apply_actions(batch)
+        else:
+            store.apply_action(actions.next())
+        _check(store)
+    store.close()
+
+
+def test_reload_matches_incremental_state(workdir):
+    store = CharacterAppStore(workdir, snapshot=False)
+    actions = _Actions(store, random.Random(42))
+    for _ in range(60):
+        store.apply_action(actions.next())
+    state = store.build_state()
+    store.close()
+    reloaded = CharacterAppStore(workdir, snapshot=False)
+    assert _persisted(reloaded.build_state()["inventory"]) == _persisted(state["inventory"])
+    assert reloaded.build_state()["stats"] == state["stats"]
+    reloaded.close()
@@ -0,0 +1,82 @@
+import json
+
+from xlsx_store import ActionJournal, CharacterAppStore, XlsxMini
+
+ITEM = {"Objet": "corde", "Prix unitaire (en crédit)": "3", "Quantité": "2", "poid unitaire (kg)": "1"}
+
+
+def _open(workdir, **options) -> CharacterAppStore:
+    return CharacterAppStore(workdir, snapshot=False, journal=True, **options)
+
+
+def _crash(store: CharacterAppStore):
+    store._journal.close()
+
+
+def test_replay_after_crash_restores_state_and_ids(workdir):
+    store = _open(workdir, checkpoint_every=1000)
+    store.apply_action({"action": "update_credits", "credits": 321})
+    store.apply_action({"action": "add_item", "item": ITEM})
+    store.apply_actions([{"action": "add_skill_xp", "amount": 1500}, {"action": "sort", "key": "alpha", "source": "sac à dos"}])
+    state = store.build_state()
+    _crash(store)
+    assert [entry["seq"] for entry in ActionJournal(workdir / "journal.jsonl").pending()] == [1, 2, 3]
+
+    recovered = _open(workdir)
+    assert recovered.build_state() == {**state, "version": recovered.version, "incarnation": recovered.incarnation}
+    recovered.close()
+    assert not (workdir / "journal.jsonl").exists()
+    reloaded = CharacterAppStore(workdir, snapshot=False)
+    assert reloaded.build_state()["inventory"]["credits"] == 321
+    assert [i["id"] for i in reloaded.inv.sheets["sac à dos"]] == [i["id"] for i in recovered.inv.sheets["sac à dos"]]
+
+
+def test_checkpoint_rotates_into_archives(workdir):
+    store = _open(workdir, checkpoint_every=2)
+    for credits in (1, 2, 3):
+        store.apply_action({"action": "update_credits", "credits": credits})
+    journal = workdir / "journal.jsonl"
+    marker = json.loads((workdir / "journal.jsonl.checkpoint").read_text(encoding="utf-8"))
+    assert marker == {"seq": 2, "renames": []}
+    assert [json.loads(line)["seq"] for line in journal.read_text(encoding="utf-8").splitlines()] == [3]
+    archives = sorted((workdir / "journal").iterdir())
+    assert [json.loads(line)["seq"] for a in archives for line in a.read_text(encoding="utf-8").splitlines()] == [1, 2]
+    assert store._journal.since_checkpoint == 1
+    store.close()
+
+
+def test_checkpoint_keeps_entries_newer_than_its_snapshot(workdir):
+    journal = ActionJournal(workdir / "journal.jsonl", keep_archives=False)
+    for n in range(4):
+        journal.append({"action": {"action": "update_credits", "credits": n}})
+    data = XlsxMini.load(workdir / "inventaire.xlsx")
+    journal.checkpoint([data], seq=2)
+    journal.close()
+    reopened = ActionJournal(workdir / "journal.jsonl")
+    reopened.recover()
+    assert [entry["seq"] for entry in reopened.pending()] == [3, 4]
+    assert not (workdir / "journal").exists()
+
+
+def test_pending_stops_at_a_torn_line(workdir):
+    journal = ActionJournal(workdir / "journal.jsonl")
+    journal.append({"action": {"action": "update_credits", "credits": 1}})
+    journal.close()
+    with open(workdir / "journal.jsonl", "ab") as fh:
+        fh.write(b'{"seq": 2, "action": {"act')
+    assert [entry["seq"] for entry in ActionJournal(workdir / "journal.jsonl").pending()] == [1]
+
+
+def test_recover_finishes_an_interrupted_checkpoint(workdir):
+    path = workdir / "inventaire.xlsx"
+    data = XlsxMini.load(path)
+    data.sheets["coffre"].append({"Objet": "lanterne", "Quantité": "1"})
+    tmp, _ = XlsxMini.write_temp(data)
+    journal = ActionJournal(workdir / "journal.jsonl")
+    journal._write_checkpoint({"seq": 5, "renames": [[str(tmp), str(path)]]})
+
+    journal.recover()
+
+    assert journal.seq == 5
+    assert not tmp.exists()
+    assert XlsxMini.load(path).sheets["coffre"][-1]["Objet"] == "lanterne"
@@ -0,0 +1,106 @@
+import copy
+import json
+import random
+
+from xlsx_store import json_patch
+
+
+def _apply(doc, ops):
+    for op in ops:
+        if op["path"] == "":
+            doc = copy.deepcopy(op["value"])
+            continue
+        *parents, last = [part.replace("~1", "/").replace("~0", "~") for part in op["path"].split("/")[1:]]
+        target = doc
+        for part in parents:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        key = int(last) if isinstance(target, list) else last
+        if op["op"] == "remove":
+            del target[key]
+        elif op["op"] == "add" and isinstance(target, list):
+            target.insert(key, copy.deepcopy(op["value"]))
+        else:
+            target[key] = copy.deepcopy(op["value"])
+    return doc
+
+
+def _random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(6 if depth < 3 else 4)
+    if kind == 0:
+        return rng.randint(2, 5)
+    if kind == 1:
+        return rng.choice(["a", "b", "é", ""])
+    if kind == 2:
+        return rng.choice([None, 2.5])
+    if kind == 3:
+        return rng.random() < 0.5
+    if kind == 4:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {rng.choice(["x", "y", "a/b", "m~n", "clé"]): _random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+def test_escaped_pointers():
+    old = {"a/b": 1, "m~n": [1, 2]}
+    new = {"a/b": 2, "m~n": [1]}
+    assert json_patch(old, new) == [
+        {"op": "replace", "path": "/a~1b", "value": 2},
+        {"op": "remove", "path": "/m~0n/1"},
+    ]
+
+
+def test_list_edits_touch_only_the_changed_span():
+    old = {"bag": [{"id": i} for i in range(10)]}
+    new = {"bag": old["bag"][:4] + [{"id": "x"}] + old["bag"][6:]}
+    assert json_patch(old, new, "/inventory") == [
+        {"op": "replace", "path": "/inventory/bag/4/id", "value": "x"},
+        {"op": "remove", "path": "/inventory/bag/5"},
+    ]
+
+
+def test_type_changes_are_replaced():
+    assert json_patch({"v": 1}, {"v": 1.0}) == [{"op": "replace", "path": "/v", "value": 1.0}]
+    assert json_patch({"v": True}, {"v": 1}) == [{"op": "replace", "path": "/v", "value": 1}]
+    assert json_patch([1], {"0": 1}) == [{"op": "replace", "path": "", "value": {"0": 1}}]
+    assert json_patch([True, 2], [1, 2]) == [{"op": "replace", "path": "/0", "value": 1}]
+    assert json_patch([2, False], [2, 0]) == [{"op": "replace", "path": "/1", "value": 0}]
+
+
+def test_applying_the_patch_reproduces_the_target():
+    rng = random.Random(0)
+    for _ in range(2000):
+        old, new = _random_value(rng), _random_value(rng)
+        if rng.random() < 0.5 and isinstance(old, (dict, list)):
+            new = copy.deepcopy(old)
+            new = _apply(new, json_patch(new, _random_value(rng))) if rng.random() < 0.2 else new
+            if isinstance(new, list) and new:
+                new[rng.randrange(len(new))] = _random_value(rng)
+            elif isinstance(new, dict):
+                new[rng.choice(["x", "a/b", "z"])] = _random_value(rng)
+        patched = _apply(copy.deepcopy(old), json_patch(old, new))
+        assert json.dumps(patched, sort_keys=True) == json.dumps(new, sort_keys=True)
+
+
+def test_base_version_from_another_incarnation_gets_the_full_state(workdir):
+    from xlsx_store import CharacterAppStore
+
+    store = CharacterAppStore(workdir, snapshot=False)
+    store.apply_action({"action": "add_item", "item": {"Objet": "alpha", "Prix unitaire (en crédit)": "5"}})
+    client = store.build_state()
+    store.close()
+
+    restarted = CharacterAppStore(workdir, snapshot=False)
+    assert restarted.incarnation != client["incarnation"]
+    alpha = next(i for i in restarted.inv.sheets["sac à dos"] if i["Objet"] == "alpha")
+    restarted.apply_action({"action": "sell", "id": alpha["id"], "qty": 1})
+    assert restarted.version == client["version"]
+
+    stale = restarted.apply_action({"action": "update_hp", "value": 3, "base_version": client["version"], "incarnation": client["incarnation"]})
+    assert "patch" not in stale
+    assert stale["state"]["incarnation"] == restarted.incarnation
+    assert all(i["Objet"] != "alpha" for i in stale["state"]["inventory"]["bag"])
+    assert "patch" not in restarted.apply_action({"action": "update_hp", "value": 4, "base_version": restarted.version})
+
+    current = restarted.apply_action({"action": "update_hp", "value": 5, "base_version": restarted.version, "incarnation": restarted.incarnation})
+    assert current["incarnation"] == restarted.incarnation
+    assert current["patch"]
+    restarted.close()
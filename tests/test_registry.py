@@ -0,0 +1,112 @@
+import shutil
+import threading
+from http import HTTPStatus
+
+from api import api_get
+from registry import CHARACTERS_DIR, CHARACTER_FILES, StoreRegistry
+
+
+def _add_character(root, name):
+    folder = root / CHARACTERS_DIR / name
+    folder.mkdir(parents=True)
+    for file in CHARACTER_FILES:
+        shutil.copy(root / file, folder / file)
+
+
+def test_lru_eviction_keeps_leased_stores(workdir):
+    for name in ("alice", "bob"):
+        _add_character(workdir, name)
+    registry = StoreRegistry(workdir, max_stores=2, snapshot=False)
+    with registry.lease("alice") as alice:
+        alice.apply_action({"action": "update_credits", "credits": 42})
+        registry.acquire("default")
+        registry.release("default")
+        registry.acquire("bob")
+        registry.release("bob")
+        assert registry.is_loaded("alice")
+        assert not registry.is_loaded("default")
+    registry.acquire("default")
+    registry.release("default")
+    assert not registry.is_loaded("alice")
+    with registry.lease("alice") as reloaded:
+        assert reloaded is not alice
+        assert reloaded.build_state()["inventory"]["credits"] == 42
+    registry.close()
+
+
+def test_measuring_does_not_hold_the_registry_lock(workdir):
+    _add_character(workdir, "alice")
+    registry = StoreRegistry(workdir, snapshot=False)
+    default = registry.acquire("default")
+    registry.release("default")
+    default.apply_action({"action": "update_credits", "credits": 1})
+    measuring, resume = threading.Event(), threading.Event()
+    estimate = default.memory_estimate
+
+    def slow_estimate():
+        measuring.set()
+        resume.wait(5)
+        return estimate()
+
+    def load_alice():
+        registry.acquire("alice")
+        registry.release("alice")
+
+    default.memory_estimate = slow_estimate
+    loader = threading.Thread(target=load_alice)
+    loader.start()
+    assert measuring.wait(5)
+    acquired = []
+    reader = threading.Thread(target=lambda: acquired.append(registry.acquire("default")))
+    reader.start()
+    reader.join(2)
+    resume.set()
+    loader.join(5)
+    assert acquired == [default]
+    registry.release("default")
+    registry.close()
+
+
+def test_try_lease_never_loads_or_waits(workdir):
+    registry = StoreRegistry(workdir, snapshot=False)
+    with registry.try_lease("default") as store:
+        assert store is None
+    assert not registry.is_loaded("default")
+    loaded = registry.acquire("default")
+    registry.release("default")
+    with registry._lock:
+        assert registry.try_acquire("default") is None
+    with registry.try_lease("default") as store:
+        assert store is loaded
+        assert registry.metrics()["leases"] == {"default": 1}
+    assert registry.metrics()["leases"] == {}
+    registry.close()
+
+
+def test_reloaded_store_rejects_etags_and_bases_from_before_eviction(workdir):
+    _add_character(workdir, "alice")
+    registry = StoreRegistry(workdir, max_stores=1, snapshot=False)
+    with registry.lease("alice") as alice:
+        alice.apply_action({"action": "update_hp", "value": 3})
+        old_state = alice.build_state()
+    old_etag = api_get(registry, "alice", "/api/state").headers["ETag"]
+    old_section_etag = api_get(registry, "alice", "/api/state/stats").headers["ETag"]
+
+    with registry.lease("default"):
+        pass
+    assert not registry.is_loaded("alice")
+
+    with registry.lease("alice") as reloaded:
+        events = reloaded.events.subscribe()
+        stale = reloaded.apply_action({"action": "update_hp", "value": 7, "base_version": old_state["version"], "incarnation": old_state["incarnation"]})
+        assert reloaded.version == old_state["version"]
+        event = events.get_nowait()
+    assert "patch" not in stale
+    assert stale["state"]["stats"] != old_state["stats"]
+    assert event["incarnation"] == stale["state"]["incarnation"] != old_state["incarnation"]
+
+    response = api_get(registry, "alice", "/api/state", old_etag)
+    assert response.status == HTTPStatus.OK
+    assert response.headers["ETag"] != old_etag
+    assert api_get(registry, "alice", "/api/state/stats", old_section_etag).status == HTTPStatus.OK
+    registry.close()
@@ -0,0 +1,74 @@
+import re
+import zipfile
+
+import pytest
+
+import xlsx_store
+from xlsx_store import MAX_COLUMNS, SHARED_STRINGS_PART, XlsxMini, _COLUMN_LETTERS
+
+
+def test_column_letters_cover_the_sheet_width():
+    assert len(_COLUMN_LETTERS) == MAX_COLUMNS
+    assert _COLUMN_LETTERS[:3] == ("A", "B", "C")
+    assert _COLUMN_LETTERS[25:28] == ("Z", "AA", "AB")
+    assert _COLUMN_LETTERS[-1] == "XFD"
+    assert all(XlsxMini._col_to_idx(col) == i for i, col in enumerate(_COLUMN_LETTERS))
+
+
+def test_sheet_xml_references_match_headers():
+    headers = [f"h{i}" for i in range(60)]
+    xml = XlsxMini._sheet_xml(headers, [{h: "x" for h in headers}])
+    refs = re.findall(r'<c r="([A-Z]+)2"', xml)
+    assert refs == list(_COLUMN_LETTERS[:60])
+
+
+def _rows(data):
+    return {name: [dict(row) for row in rows] for name, rows in data.sheets.items()}
+
+
+def test_incremental_save_round_trip(workdir):
+    path = workdir / "inventaire.xlsx"
+    with zipfile.ZipFile(path) as zf:
+        before = {info.filename: (info.CRC, info.extra, info.external_attr) for info in zf.infolist()}
+    data = XlsxMini.load(path)
+    sheet = next(iter(data.sheets))
+    data.sheets[sheet].append({h: f"é{i}" for i, h in enumerate(data.headers[sheet]) if h})
+    expected = _rows(data)
+
+    assert XlsxMini.save(data) == [sheet]
+
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        after = {info.filename: (info.CRC, info.extra, info.external_attr) for info in zf.infolist()}
+    assert list(after) == list(before)
+    changed = {name for name in before if before[name] != after[name]}
+    assert changed == {data.parts[sheet]}
+    assert _rows(XlsxMini.load(path)) == expected
+
+
+def test_incremental_save_with_shared_strings(workdir):
+    path = workdir / "caracteristique.xlsx"
+    data = XlsxMini.load(path)
+    data.shared_strings = True
+    XlsxMini.save(data, incremental=False)
+    data = XlsxMini.load(path)
+    data.shared_strings = True
+    sheet = next(iter(data.sheets))
+    data.sheets[sheet][0][data.headers[sheet][0]] = "valeur inédite"
+    expected = _rows(data)
+
+    assert XlsxMini.save(data) == [sheet]
+
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert SHARED_STRINGS_PART in zf.namelist()
+    assert _rows(XlsxMini.load(path)) == expected
+
+
+@pytest.mark.parametrize("workbook", ["magasin.xlsx", "inventaire.xlsx", "caracteristique.xlsx"])
+def test_streamed_and_in_memory_parsing_agree(workdir, monkeypatch, workbook):
+    in_memory = XlsxMini.load(workdir / workbook)
+    monkeypatch.setattr(xlsx_store, "STREAM_PART_SIZE", 0)
+    streamed = XlsxMini.load(workdir / workbook)
+    assert streamed.headers == in_memory.headers
+    assert streamed.sheets == in_memory.sheets
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+from urllib.parse import unquote
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+THUMBNAIL_SIZE = 104
+THUMBNAIL_PREFIX = "thumbs/"
+
+
+class ThumbnailCache:
+    def __init__(self, image_dir: Path, cache_dir: Path, size: int = THUMBNAIL_SIZE):
+        self.image_dir = image_dir
+        self.cache_dir = cache_dir
+        self.size = size
+        self.generated = 0
+        self.failed: set[str] = set()
+        self._keys: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def url(self, resolved_image: str) -> str:
+        if not self.available or not resolved_image.startswith("image/"):
+            return resolved_image
+        name = resolved_image[len("image/"):]
+        if "/" in name or name in self.failed or not (self.image_dir / name).is_file():
+            return resolved_image
+        return THUMBNAIL_PREFIX + name
+
+    def _source_key(self, source: Path) -> str:
+        st = source.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            known = self._keys.get(source.name)
+            if known and known[0] == stamp:
+                return known[1]
+        key = hashlib.sha1(source.read_bytes()).hexdigest()[:16]
+        with self._lock:
+            self._keys[source.name] = (stamp, key)
+        return key
+
+    def path_for(self, url_path: str) -> Path | None:
+        name = unquote(url_path.lstrip("/"))[len(THUMBNAIL_PREFIX):]
+        if not self.available or not name or "/" in name or name.startswith("."):
+            return None
+        source = self.image_dir / name
+        if not source.is_file():
+            return None
+        dest = self.cache_dir / f"{self._source_key(source)}-{self.size}{'.png' if source.suffix.lower() == '.png' else '.jpg'}"
+        if dest.exists():
+            return dest
+        try:
+            self._generate(source, dest)
+        except (OSError, ValueError) as exc:
+            print(f"Miniature impossible pour {name}: {exc}")
+            self.failed.add(name)
+            return source
+        return dest
+
+    def _generate(self, source: Path, dest: Path):
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            scale = self.size / min(img.size)
+            if scale < 1:
+                img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.tmp")
+            try:
+                if dest.suffix == ".png":
+                    img.save(tmp, "PNG", optimize=True)
+                else:
+                    img.convert("RGB").save(tmp, "JPEG", quality=82, optimize=True, progressive=True)
+                os.replace(tmp, dest)
+            finally:
+                tmp.unlink(missing_ok=True)
+        self.generated += 1
@@ -1,16 +1,41 @@
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
 import math
+import os
+import pickle
 import unicodedata
 import re
+import shutil
+import struct
+import sys
+import threading
+import time
 import uuid
 import zipfile
-from dataclasses import dataclass
+import zlib
+from collections import deque
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from fractions import Fraction
 from pathlib import Path
+from types import MappingProxyType
 from xml.etree import ElementTree as ET
 
+from events import StateEvents
+from thumbnails import ThumbnailCache
+
 NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
 NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_TAG_SHEET_DATA = f"{{{NS_MAIN}}}sheetData"
+_TAG_ROW = f"{{{NS_MAIN}}}row"
+_TAG_SI = f"{{{NS_MAIN}}}si"
+_TAG_T = f"{{{NS_MAIN}}}t"
+_TAG_C = f"{{{NS_MAIN}}}c"
+_TAG_V = f"{{{NS_MAIN}}}v"
+_TAG_IS = f"{{{NS_MAIN}}}is"
 
 SKILL_TREE_DEFINITIONS = [
     {
@@ -85,76 +110,409 @@ SKILL_TREE_DEFINITIONS = [
 
 
 
+class LazySheets(MutableMapping):
+    def __init__(self, names: list[str], loader):
+        self._order = list(names)
+        self._loader = loader
+        self._rows: dict[str, list[dict]] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> list[dict]:
+        rows = self._rows.get(name)
+        if rows is not None:
+            return rows
+        if name not in self._order:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._rows:
+                self._rows[name] = self._loader(name)
+        return self._rows[name]
+
+    def __setitem__(self, name: str, rows: list[dict]):
+        if name not in self._order:
+            self._order.append(name)
+        self._rows[name] = rows
+
+    def __delitem__(self, name: str):
+        self._order.remove(name)
+        self._rows.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._rows
+
+    def loaded(self) -> dict[str, list[dict]]:
+        return {name: self._rows[name] for name in self._order if name in self._rows}
+
+
 @dataclass
 class WorkbookData:
     path: Path
     sheets: dict[str, list[dict]]
     headers: dict[str, list[str]]
+    signatures: dict[str, int] = field(default_factory=dict, repr=False)
+    layout: tuple[str, ...] = field(default=(), repr=False)
+    parts: dict[str, str] = field(default_factory=dict, repr=False)
+    shared_strings: bool = field(default=False, repr=False)
+
+    @staticmethod
+    def _sheet_signature(headers: list[str], rows: list[dict]) -> int:
+        return hash((tuple(headers), tuple(tuple(str(r.get(h, "")) for h in headers) for r in rows)))
+
+    def loaded_sheets(self) -> dict[str, list[dict]]:
+        return self.sheets.loaded() if isinstance(self.sheets, LazySheets) else self.sheets
+
+    def mark_clean(self):
+        self.layout = tuple(self.sheets)
+        self.signatures = {name: self._sheet_signature(self.headers.get(name, []), rows) for name, rows in self.loaded_sheets().items()}
+
+    def dirty_sheets(self) -> list[str]:
+        return [
+            name for name, rows in self.loaded_sheets().items()
+            if self.signatures.get(name) != self._sheet_signature(self.headers.get(name, []), rows)
+        ]
+
+    def mark_dirty(self):
+        self.layout = ()
+        self.signatures = {}
+
+    def is_dirty(self) -> bool:
+        return tuple(self.sheets) != self.layout or bool(self.dirty_sheets())
+
+    def snapshot(self) -> WorkbookData:
+        return WorkbookData(
+            self.path,
+            {name: [dict(r) for r in rows] for name, rows in self.sheets.items()},
+            {name: list(headers) for name, headers in self.headers.items()},
+            dict(self.signatures),
+            self.layout,
+            dict(self.parts),
+            self.shared_strings,
+        )
+
+    def adopt(self, saved: WorkbookData):
+        self.signatures = saved.signatures
+        self.layout = saved.layout
+        self.parts = saved.parts
+
+
+SHARED_STRINGS_PART = "xl/sharedStrings.xml"
+STREAM_PART_SIZE = 256 * 1024
+MAX_COLUMNS = 16384
+_NUMBER_RE = re.compile(r"-?\d+(\.\d+)?")
+_NON_ALPHA_RE = re.compile(r"[^a-z]")
+_ROW_DIGITS = "0123456789"
+
+
+@functools.lru_cache(maxsize=8192)
+def _is_number_text(value: str) -> bool:
+    return _NUMBER_RE.fullmatch(value) is not None
+
+
+@functools.lru_cache(maxsize=8192)
+def _escape_xml(value: str) -> str:
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class _StringTable:
+    def __init__(self, values: list[str] | None = None):
+        self.values = list(values or [])
+        self._index: dict[str, int] = {}
+        for i, v in enumerate(self.values):
+            self._index.setdefault(v, i)
+        self._loaded = len(self.values)
+
+    @property
+    def grown(self) -> bool:
+        return len(self.values) > self._loaded
+
+    def index(self, value: str) -> int:
+        idx = self._index.get(value)
+        if idx is None:
+            idx = self._index[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+class _ZipWriter:
+    LOCAL = struct.Struct("<4s2B4HL2L2H")
+    CENTRAL = struct.Struct("<4s4B4HL2L5H2L")
+    END = struct.Struct("<4s4H2LH")
+    ZIP64_EXTRA = 0x0001
+    UTF8_FLAG = 0x800
+    DESCRIPTOR_FLAG = 0x08
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.central: list[bytes] = []
+
+    @staticmethod
+    def _dos_time(date_time: tuple) -> tuple[int, int]:
+        year, month, day, hour, minute, second = date_time
+        return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+    @staticmethod
+    def _strip_zip64(extra: bytes) -> bytes:
+        kept = []
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, size = struct.unpack_from("<HH", extra, pos)
+            if tag != _ZipWriter.ZIP64_EXTRA:
+                kept.append(extra[pos:pos + 4 + size])
+            pos += 4 + size
+        return b"".join(kept)
+
+    def write(self, info: zipfile.ZipInfo, name: bytes, raw: bytes, local_extra: bytes = b""):
+        offset = self.fh.tell()
+        flags = info.flag_bits & ~self.DESCRIPTOR_FLAG
+        dos_time, dos_date = self._dos_time(info.date_time)
+        local_extra = self._strip_zip64(local_extra)
+        central_extra = self._strip_zip64(info.extra)
+        common = (flags, info.compress_type, dos_time, dos_date, info.CRC, len(raw), info.file_size, len(name))
+        self.fh.write(self.LOCAL.pack(b"PK\x03\x04", info.extract_version, info.reserved, *common, len(local_extra)))
+        self.fh.write(name)
+        self.fh.write(local_extra)
+        self.fh.write(raw)
+        self.central.append(self.CENTRAL.pack(
+            b"PK\x01\x02", info.create_version, info.create_system, info.extract_version, info.reserved, *common,
+            len(central_extra), len(info.comment), 0, info.internal_attr, info.external_attr, offset,
+        ) + name + central_extra + info.comment)
+
+    def writestr(self, filename: str, text: str):
+        data = text.encode("utf-8")
+        deflate = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        raw = deflate.compress(data) + deflate.flush()
+        info = zipfile.ZipInfo(filename, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o600 << 16
+        info.CRC = zlib.crc32(data)
+        info.file_size = len(data)
+        try:
+            name = filename.encode("ascii")
+        except UnicodeEncodeError:
+            name = filename.encode("utf-8")
+            info.flag_bits |= self.UTF8_FLAG
+        self.write(info, name, raw)
+
+    def close(self):
+        offset = self.fh.tell()
+        for entry in self.central:
+            self.fh.write(entry)
+        size = self.fh.tell() - offset
+        count = len(self.central)
+        self.fh.write(self.END.pack(b"PK\x05\x06", 0, 0, count, count, size, offset, 0))
+
+
+class SnapshotCache:
+    VERSION = 1
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._keys: dict[Path, tuple] = {}
+        self._lock = threading.Lock()
+
+    def file_key(self, path: Path) -> tuple:
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            known = self._keys.get(path)
+            if known and known[:2] == stamp:
+                return known
+            key = (*stamp, hashlib.sha1(path.read_bytes()).hexdigest())
+            self._keys[path] = key
+            return key
+
+    def _file(self, path: Path, name: str) -> Path:
+        return self.directory / f"{path.name}.{hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]}.pickle"
+
+    def get(self, path: Path, name: str, extra: str = ""):
+        try:
+            with open(self._file(path, name), "rb") as fh:
+                key, value = pickle.load(fh)
+            valid = key == (self.VERSION, self.file_key(path), extra)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, AttributeError):
+            valid = False
+        if not valid:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, path: Path, name: str, value, extra: str = ""):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            target = self._file(path, name)
+            tmp = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as fh:
+                pickle.dump(((self.VERSION, self.file_key(path), extra), value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, target)
+        except OSError:
+            pass
+
+    def refresh(self, data: WorkbookData, extra: str = ""):
+        self.put(data.path, "", data.parts, extra)
+        for name, rows in data.loaded_sheets().items():
+            headers = data.headers.get(name, [])
+            self.put(data.path, name, (list(headers), XlsxMini.project_rows(headers, rows)), extra)
 
 
 class XlsxMini:
     @staticmethod
-    def load(path: Path) -> WorkbookData:
-        zf = zipfile.ZipFile(path)
-        wb = ET.fromstring(zf.read("xl/workbook.xml"))
-        rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
-        rid_to_target = {r.attrib["Id"]: r.attrib["Target"] for r in rels}
+    def load(path: Path, lazy: bool = False, on_sheet=None, snapshot: SnapshotCache | None = None, snapshot_key: str = "") -> WorkbookData:
+        opened: list[zipfile.ZipFile] = []
+
+        def archive() -> zipfile.ZipFile:
+            if not opened:
+                opened.append(zipfile.ZipFile(path))
+            return opened[0]
 
+        try:
+            parts = snapshot.get(path, "", snapshot_key) if snapshot else None
+            if parts is None:
+                zf = archive()
+                wb = ET.fromstring(zf.read("xl/workbook.xml"))
+                rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+                rid_to_target = {r.attrib["Id"]: r.attrib["Target"] for r in rels}
+                parts = {}
+                for sheet in wb.find(f"{{{NS_MAIN}}}sheets"):
+                    rid = sheet.attrib[f"{{{NS_REL}}}id"]
+                    parts[sheet.attrib["name"]] = XlsxMini._part_name(rid_to_target[rid])
+                if snapshot:
+                    snapshot.put(path, "", parts, snapshot_key)
+
+            data = WorkbookData(path=path, sheets={}, headers={}, parts=dict(parts))
+            shared: list[list[str]] = []
+
+            def parse(name: str, zf: zipfile.ZipFile) -> tuple[list[str], list[dict]]:
+                if not shared:
+                    shared.append(XlsxMini._read_shared_strings(zf) if SHARED_STRINGS_PART in zf.namelist() else [])
+                headers, rows = XlsxMini._read_sheet(zf, data.parts[name], shared[0])
+                if on_sheet:
+                    on_sheet(name, rows)
+                if snapshot:
+                    snapshot.put(data.path, name, (headers, rows), snapshot_key)
+                return headers, rows
+
+            def read(name: str, zf=None) -> list[dict]:
+                cached = snapshot.get(data.path, name, snapshot_key) if snapshot else None
+                if cached is None and zf is not None:
+                    cached = parse(name, zf())
+                elif cached is None:
+                    with zipfile.ZipFile(data.path) as own:
+                        cached = parse(name, own)
+                headers, rows = cached
+                data.headers[name] = headers
+                data.signatures[name] = data._sheet_signature(headers, rows)
+                return rows
+
+            if lazy:
+                data.sheets = LazySheets(list(parts), read)
+            else:
+                data.sheets = {name: read(name, archive) for name in parts}
+        finally:
+            for zf in opened:
+                zf.close()
+        data.layout = tuple(data.sheets)
+        return data
+
+    @staticmethod
+    def _streamed(zf: zipfile.ZipFile, part: str) -> bool:
+        return zf.getinfo(part).file_size > STREAM_PART_SIZE
+
+    @staticmethod
+    def project_rows(headers: list[str], rows: list[dict]) -> list[dict]:
+        projected = []
+        for r in rows:
+            vals = [str(r.get(h, "")) for h in headers]
+            if any(v != "" for v in vals):
+                projected.append({h: v for h, v in zip(headers, vals) if h != ""})
+        return projected
+
+    @staticmethod
+    def _read_shared_strings(zf: zipfile.ZipFile) -> list[str]:
+        if not XlsxMini._streamed(zf, SHARED_STRINGS_PART):
+            root = ET.fromstring(zf.read(SHARED_STRINGS_PART))
+            return ["".join((t.text or "") for t in si.iter(_TAG_T)) for si in root.iter(_TAG_SI)]
         shared = []
-        if "xl/sharedStrings.xml" in zf.namelist():
-            sst = ET.fromstring(zf.read("xl/sharedStrings.xml"))
-            for si in sst.findall(f"{{{NS_MAIN}}}si"):
-                text = "".join((t.text or "") for t in si.findall(f".//{{{NS_MAIN}}}t"))
-                shared.append(text)
-
-        sheets: dict[str, list[dict]] = {}
-        headers: dict[str, list[str]] = {}
-        for sheet in wb.find(f"{{{NS_MAIN}}}sheets"):
-            name = sheet.attrib["name"]
-            rid = sheet.attrib[f"{{{NS_REL}}}id"]
-            target = "xl/" + rid_to_target[rid]
-            xml = ET.fromstring(zf.read(target))
-            rows = xml.findall(f"{{{NS_MAIN}}}sheetData/{{{NS_MAIN}}}row")
-            if not rows:
-                sheets[name] = []
-                headers[name] = []
-                continue
-            header_values = XlsxMini._row_values(rows[0], shared)
-            headers[name] = header_values
-            sheet_rows = []
-            for row in rows[1:]:
-                vals = XlsxMini._row_values(row, shared)
-                if not any(v != "" for v in vals):
+        root = None
+        with zf.open(SHARED_STRINGS_PART) as fh:
+            for event, el in ET.iterparse(fh, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = el
                     continue
-                row_data = {header_values[i]: (vals[i] if i < len(vals) else "") for i in range(len(header_values)) if header_values[i] != ""}
-                sheet_rows.append(row_data)
-            sheets[name] = sheet_rows
+                if el.tag == _TAG_SI:
+                    shared.append("".join((t.text or "") for t in el.iter(_TAG_T)))
+                    root.clear()
+        return shared
+
+    @staticmethod
+    def iter_rows(fh, shared: list[str]):
+        for _, el in ET.iterparse(fh):
+            if el.tag == _TAG_ROW:
+                yield XlsxMini._row_values(el, shared)
+                el.clear()
+            elif el.tag == _TAG_SHEET_DATA:
+                el.clear()
+
+    @staticmethod
+    def _read_sheet(zf: zipfile.ZipFile, part: str, shared: list[str]) -> tuple[list[str], list[dict]]:
+        if not XlsxMini._streamed(zf, part):
+            row_values = XlsxMini._row_values
+            return XlsxMini._sheet_rows(row_values(row, shared) for row in ET.fromstring(zf.read(part)).iter(_TAG_ROW))
+        with zf.open(part) as fh:
+            return XlsxMini._sheet_rows(XlsxMini.iter_rows(fh, shared))
+
+    @staticmethod
+    def _sheet_rows(rows) -> tuple[list[str], list[dict]]:
+        header_values = next(rows, None)
+        if header_values is None:
+            return [], []
+        sheet_rows = []
+        for vals in rows:
+            if not any(v != "" for v in vals):
+                continue
+            row_data = {header_values[i]: (vals[i] if i < len(vals) else "") for i in range(len(header_values)) if header_values[i] != ""}
+            sheet_rows.append(row_data)
+        return header_values, sheet_rows
 
-        return WorkbookData(path=path, sheets=sheets, headers=headers)
+    @staticmethod
+    def _part_name(target: str) -> str:
+        return target.lstrip("/") if target.startswith("/") else "xl/" + target
 
     @staticmethod
     def _row_values(row, shared: list[str]) -> list[str]:
-        cells = {}
-        for c in row.findall(f"{{{NS_MAIN}}}c"):
-            ref = c.attrib.get("r", "A1")
-            col = re.match(r"([A-Z]+)", ref).group(1)
-            idx = XlsxMini._col_to_idx(col)
-            t = c.attrib.get("t")
+        values: list[str] = []
+        col_to_idx = XlsxMini._col_to_idx
+        for c in row:
+            if c.tag != _TAG_C:
+                continue
+            idx = col_to_idx(c.get("r", "A1").rstrip(_ROW_DIGITS))
             val = ""
-            v = c.find(f"{{{NS_MAIN}}}v")
-            if v is not None and v.text is not None:
-                val = shared[int(v.text)] if t == "s" else v.text
-            else:
-                isel = c.find(f"{{{NS_MAIN}}}is/{{{NS_MAIN}}}t")
-                if isel is not None and isel.text is not None:
-                    val = isel.text
-            cells[idx] = val
-        if not cells:
-            return []
-        max_idx = max(cells)
-        return [cells.get(i, "") for i in range(max_idx + 1)]
+            for child in c:
+                if child.tag == _TAG_V:
+                    if child.text is not None:
+                        val = shared[int(child.text)] if c.get("t") == "s" else child.text
+                    break
+                if child.tag == _TAG_IS:
+                    inline = next(iter(child), None)
+                    if inline is not None and inline.tag == _TAG_T and inline.text is not None:
+                        val = inline.text
+                    break
+            if idx >= len(values):
+                values.extend([""] * (idx + 1 - len(values)))
+            values[idx] = val
+        return values
 
     @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def _col_to_idx(col: str) -> int:
         n = 0
         for ch in col:
@@ -171,25 +529,158 @@ class XlsxMini:
         return out
 
     @staticmethod
-    def save(data: WorkbookData):
+    def save(data: WorkbookData, incremental: bool = True, backups: int = 0) -> list[str]:
+        tmp, written = XlsxMini.write_temp(data, incremental)
+        try:
+            XlsxMini.commit(tmp, data.path, backups)
+        except BaseException:
+            data.mark_dirty()
+            raise
+        return written
+
+    @staticmethod
+    def temp_path(path: Path) -> Path:
+        return path.with_name(f".{path.name}.tmp")
+
+    @staticmethod
+    def backup_path(path: Path, n: int) -> Path:
+        return path.with_name(f"{path.name}.bak{n}")
+
+    @staticmethod
+    def write_temp(data: WorkbookData, incremental: bool = True) -> tuple[Path, list[str]]:
+        tmp = XlsxMini.temp_path(data.path)
+        try:
+            with open(tmp, "wb") as fh:
+                written = None
+                if incremental and data.path.exists() and tuple(data.sheets) == data.layout and set(data.parts) >= set(data.sheets):
+                    dirty = data.dirty_sheets()
+                    try:
+                        XlsxMini._write_incremental(data, dirty, fh)
+                        written = dirty
+                    except (zipfile.BadZipFile, KeyError, OSError, struct.error):
+                        fh.seek(0)
+                        fh.truncate()
+                if written is None:
+                    written = XlsxMini._write_full(data, fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        data.mark_clean()
+        return tmp, written
+
+    @staticmethod
+    def commit(tmp: Path, path: Path, backups: int = 0):
+        if backups > 0 and path.exists():
+            for n in range(backups - 1, 0, -1):
+                if XlsxMini.backup_path(path, n).exists():
+                    os.replace(XlsxMini.backup_path(path, n), XlsxMini.backup_path(path, n + 1))
+            first = XlsxMini.backup_path(path, 1)
+            first.unlink(missing_ok=True)
+            try:
+                os.link(path, first)
+            except OSError:
+                shutil.copy2(path, first)
+        os.replace(tmp, path)
+        XlsxMini._fsync_dir(path.parent)
+
+    @staticmethod
+    def _fsync_dir(directory: Path):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def load_with_recovery(path: Path, **kwargs) -> WorkbookData:
+        XlsxMini.temp_path(path).unlink(missing_ok=True)
+        try:
+            return XlsxMini.load(path, **kwargs)
+        except (zipfile.BadZipFile, ET.ParseError, KeyError, OSError) as exc:
+            error = exc
+        n = 1
+        while XlsxMini.backup_path(path, n).exists():
+            backup = XlsxMini.backup_path(path, n)
+            try:
+                data = XlsxMini.load(backup, **kwargs)
+            except (zipfile.BadZipFile, ET.ParseError, KeyError, OSError):
+                n += 1
+                continue
+            tmp = XlsxMini.temp_path(path)
+            shutil.copy2(backup, tmp)
+            XlsxMini.commit(tmp, path)
+            data.path = path
+            print(f"{path.name} illisible ({error}), restauré depuis {backup.name}")
+            return data
+        raise error
+
+    @staticmethod
+    def _write_incremental(data: WorkbookData, dirty: list[str], fh):
+        with open(data.path, "rb") as src, zipfile.ZipFile(src) as old:
+            strings = None
+            if data.shared_strings:
+                if SHARED_STRINGS_PART not in old.namelist():
+                    raise KeyError(SHARED_STRINGS_PART)
+                strings = _StringTable(XlsxMini._read_shared_strings(old))
+            rewritten = {data.parts[name]: XlsxMini._sheet_xml(data.headers.get(name, []), data.sheets[name], strings) for name in dirty}
+            if strings is not None and strings.grown:
+                rewritten[SHARED_STRINGS_PART] = XlsxMini._shared_strings_xml(strings)
+            out = _ZipWriter(fh)
+            for info in old.infolist():
+                xml = rewritten.pop(info.filename, None)
+                if xml is None:
+                    XlsxMini._copy_raw(src, info, out)
+                else:
+                    out.writestr(info.filename, xml)
+            if rewritten:
+                raise KeyError(next(iter(rewritten)))
+            out.close()
+
+    @staticmethod
+    def _copy_raw(src, info: zipfile.ZipInfo, out: _ZipWriter):
+        src.seek(info.header_offset)
+        header = src.read(30)
+        if header[:4] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"En-tête local invalide pour {info.filename}")
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        name = src.read(name_len)
+        extra = src.read(extra_len)
+        out.write(info, name, src.read(info.compress_size), extra)
+
+    @staticmethod
+    def _write_full(data: WorkbookData, fh) -> list[str]:
         sheets = list(data.sheets.keys())
-        with zipfile.ZipFile(data.path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("[Content_Types].xml", XlsxMini._content_types(len(sheets)))
+        strings = _StringTable() if data.shared_strings else None
+        with zipfile.ZipFile(fh, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("[Content_Types].xml", XlsxMini._content_types(len(sheets), strings is not None))
             zf.writestr("_rels/.rels", XlsxMini._root_rels())
             zf.writestr("xl/workbook.xml", XlsxMini._workbook_xml(sheets))
-            zf.writestr("xl/_rels/workbook.xml.rels", XlsxMini._workbook_rels(len(sheets)))
+            zf.writestr("xl/_rels/workbook.xml.rels", XlsxMini._workbook_rels(len(sheets), strings is not None))
             zf.writestr("xl/styles.xml", XlsxMini._styles())
             for i, name in enumerate(sheets, start=1):
                 headers = data.headers.get(name, [])
                 rows = data.sheets[name]
-                zf.writestr(f"xl/worksheets/sheet{i}.xml", XlsxMini._sheet_xml(headers, rows))
+                zf.writestr(f"xl/worksheets/sheet{i}.xml", XlsxMini._sheet_xml(headers, rows, strings))
+            if strings is not None:
+                zf.writestr(SHARED_STRINGS_PART, XlsxMini._shared_strings_xml(strings))
+        data.parts = {name: f"xl/worksheets/sheet{i}.xml" for i, name in enumerate(sheets, start=1)}
+        return sheets
 
     @staticmethod
-    def _content_types(sheet_count: int) -> str:
+    def _content_types(sheet_count: int, shared_strings: bool = False) -> str:
         overrides = "".join(
             f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
             for i in range(1, sheet_count + 1)
         )
+        if shared_strings:
+            overrides += '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
         return (
             '<?xml version="1.0" encoding="UTF-8"?>'
             '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
@@ -222,11 +713,13 @@ class XlsxMini:
         )
 
     @staticmethod
-    def _workbook_rels(sheet_count: int) -> str:
+    def _workbook_rels(sheet_count: int, shared_strings: bool = False) -> str:
         sheet_rels = "".join(
             f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet{i}.xml"/>'
             for i in range(1, sheet_count + 1)
         )
+        if shared_strings:
+            sheet_rels += f'<Relationship Id="rId{sheet_count+2}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
         return (
             '<?xml version="1.0" encoding="UTF-8"?>'
             '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
@@ -249,24 +742,22 @@ class XlsxMini:
         )
 
     @staticmethod
-    def _sheet_xml(headers: list[str], rows: list[dict]) -> str:
+    def _sheet_xml(headers: list[str], rows: list[dict], strings: _StringTable | None = None) -> str:
         all_rows = [headers] + [[str(r.get(h, "")) for h in headers] for r in rows]
+        letters = _COLUMN_LETTERS
         row_xml = []
         for r_idx, vals in enumerate(all_rows, start=1):
             cells = []
             for c_idx, val in enumerate(vals):
                 if val == "":
                     continue
-                ref = f"{XlsxMini._idx_to_col(c_idx)}{r_idx}"
-                if re.fullmatch(r"-?\d+(\.\d+)?", val):
+                ref = f"{letters[c_idx]}{r_idx}"
+                if _is_number_text(val):
                     cells.append(f'<c r="{ref}"><v>{val}</v></c>')
+                elif strings is not None:
+                    cells.append(f'<c r="{ref}" t="s"><v>{strings.index(val)}</v></c>')
                 else:
-                    safe = (
-                        val.replace("&", "&amp;")
-                        .replace("<", "&lt;")
-                        .replace(">", "&gt;")
-                    )
-                    cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{safe}</t></is></c>')
+                    cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{_escape_xml(val)}</t></is></c>')
             row_xml.append(f'<row r="{r_idx}">{"".join(cells)}</row>')
         return (
             '<?xml version="1.0" encoding="UTF-8"?>'
@@ -274,18 +765,759 @@ class XlsxMini:
             f'<sheetData>{"".join(row_xml)}</sheetData></worksheet>'
         )
 
+    @staticmethod
+    def _shared_strings_xml(strings: _StringTable) -> str:
+        items = "".join(
+            f'<si><t xml:space="preserve">{_escape_xml(v)}</t></si>' if v != v.strip() else f"<si><t>{_escape_xml(v)}</t></si>"
+            for v in strings.values
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="{len(strings.values)}">'
+            f"{items}</sst>"
+        )
+
+
+_COLUMN_LETTERS = tuple(XlsxMini._idx_to_col(i) for i in range(MAX_COLUMNS))
+
+
+class WriteBehindFlusher:
+    def __init__(self, flush, interval: float = 2.0, threshold: int = 20):
+        self._flush = flush
+        self.interval = interval
+        self.threshold = max(1, threshold)
+        self.flushes = 0
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._first_pending_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="xlsx-write-behind", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        with self._cond:
+            if self._pending == 0:
+                self._first_pending_at = time.monotonic()
+            self._pending += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending >= self.threshold:
+                        break
+                    if self._pending:
+                        remaining = self.interval - (time.monotonic() - self._first_pending_at)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed and self._pending == 0:
+                    return
+                self._pending = 0
+            try:
+                self._flush()
+                self.flushes += 1
+            except Exception as exc:
+                print(f"Échec de la sauvegarde différée: {exc}")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+
+class ActionJournal:
+    def __init__(self, path: Path, keep_archives: bool = True):
+        self.path = path
+        self.checkpoint_path = path.with_name(path.name + ".checkpoint")
+        self.archive_dir = path.with_suffix("")
+        self.keep_archives = keep_archives
+        self.seq = 0
+        self.since_checkpoint = 0
+        self._fh = None
+        self._lock = threading.Lock()
+
+    def _read_checkpoint(self) -> dict:
+        try:
+            return json.loads(self.checkpoint_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"seq": 0, "renames": []}
+
+    def _write_checkpoint(self, marker: dict):
+        tmp = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(marker, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.checkpoint_path)
+        XlsxMini._fsync_dir(self.path.parent)
+
+    def recover(self):
+        marker = self._read_checkpoint()
+        for tmp, dest in marker.get("renames", []):
+            if Path(tmp).exists():
+                XlsxMini.commit(Path(tmp), Path(dest))
+        self.seq = int(marker.get("seq", 0))
+
+    def pending(self) -> list[dict]:
+        done = self.seq
+        entries = []
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.seq = max(self.seq, int(entry.get("seq", 0)))
+                    if int(entry.get("seq", 0)) > done:
+                        entries.append(entry)
+        self.since_checkpoint = len(entries)
+        return entries
+
+    def append(self, entry: dict) -> int:
+        with self._lock:
+            if self._fh is None:
+                self._fh = open(self.path, "ab")
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "at": round(time.time(), 3), **entry}, ensure_ascii=False) + "\n"
+            self._fh.write(line.encode("utf-8"))
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self.since_checkpoint += 1
+            return self.seq
+
+    def checkpoint(self, workbooks: list[WorkbookData], backups: int = 0, seq: int | None = None) -> list[tuple[WorkbookData, list[str]]]:
+        seq = self.seq if seq is None else seq
+        staged = []
+        try:
+            for wb in workbooks:
+                tmp, written = XlsxMini.write_temp(wb)
+                staged.append((wb, tmp, written))
+        except BaseException:
+            for wb, tmp, _ in staged:
+                tmp.unlink(missing_ok=True)
+                wb.mark_dirty()
+            raise
+        self._write_checkpoint({"seq": seq, "renames": [[str(tmp), str(wb.path)] for wb, tmp, _ in staged]})
+        for wb, tmp, _ in staged:
+            XlsxMini.commit(tmp, wb.path, backups)
+        with self._lock:
+            self._rotate(seq)
+            self._write_checkpoint({"seq": seq, "renames": []})
+            self.since_checkpoint = self.seq - seq
+        return [(wb, written) for wb, _, written in staged]
+
+    def _rotate(self, seq: int):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if not self.path.exists():
+            return
+        archive = self.archive_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{seq:08d}.jsonl"
+        if seq < self.seq:
+            with open(self.path, "rb") as fh:
+                lines = fh.readlines()
+            head = []
+            for line in lines:
+                if self._entry_seq(line) > seq:
+                    break
+                head.append(line)
+            if head and self.keep_archives:
+                self.archive_dir.mkdir(exist_ok=True)
+                archive.write_bytes(b"".join(head))
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as fh:
+                fh.write(b"".join(lines[len(head):]))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.path)
+        elif self.path.stat().st_size and self.keep_archives:
+            self.archive_dir.mkdir(exist_ok=True)
+            os.replace(self.path, archive)
+        else:
+            self.path.unlink()
+
+    @staticmethod
+    def _entry_seq(line: bytes) -> float:
+        try:
+            return int(json.loads(line).get("seq", 0))
+        except ValueError:
+            return math.inf
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+STATE_SECTIONS = ("stats", "inventory", "skills_tree")
+ACTION_SECTIONS = {
+    "update_stat": ("stats", "inventory"),
+    "toggle_skill": ("stats",),
+    "toggle_expertise": ("stats",),
+    "update_hp": ("stats",),
+    "add_item": ("stats", "inventory"),
+    "add_items": ("stats", "inventory"),
+    "transfer_item": ("stats", "inventory"),
+    "transfer_items": ("stats", "inventory"),
+    "assign_type": ("stats", "inventory"),
+    "toggle_equip": ("stats", "inventory"),
+    "buy": ("stats", "inventory"),
+    "sell": ("stats", "inventory"),
+    "sort": ("inventory",),
+    "update_item": ("stats", "inventory"),
+    "update_credits": ("inventory",),
+    "add_skill_xp": ("skills_tree",),
+    "buy_skill_tree": ("skills_tree",),
+}
+
+DELTA_HISTORY = 32
+
+
+@dataclass(frozen=True)
+class StateView:
+    version: int
+    section_versions: dict[str, int]
+    sections: dict[str, object]
+    shop_sheets: tuple[str, ...]
+    encoded: dict[str, bytes] = field(default_factory=dict, repr=False)
+
+    def encode(self, key: str, build) -> bytes:
+        body = self.encoded.get(key)
+        if body is None:
+            body = json.dumps(build(), ensure_ascii=False).encode("utf-8")
+            self.encoded[key] = body
+        return body
+
+
+def _pointer(path: str, key) -> str:
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def json_patch(old, new, path: str = "") -> list[dict]:
+    if old is new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": _pointer(path, key)})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": _pointer(path, key), "value": value})
+            else:
+                ops.extend(json_patch(old[key], value, _pointer(path, key)))
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        start, shortest = 0, min(len(old), len(new))
+        while start < shortest and type(old[start]) is type(new[start]) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while end < shortest - start and type(old[-1 - end]) is type(new[-1 - end]) and old[-1 - end] == new[-1 - end]:
+            end += 1
+        old_stop, new_stop = len(old) - end, len(new) - end
+        common = min(old_stop, new_stop)
+        ops = []
+        for i in range(start, common):
+            ops.extend(json_patch(old[i], new[i], _pointer(path, i)))
+        for i in range(old_stop - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": _pointer(path, i)})
+        for i in range(common, new_stop):
+            ops.append({"op": "add", "path": _pointer(path, i), "value": new[i]})
+        return ops
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class FrozenRow(dict):
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Ligne du magasin en lecture seule")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenRow, (dict(self),)
+
+
+@dataclass(frozen=True)
+class ShopSheet:
+    name: str
+    rows: tuple[FrozenRow, ...]
+    by_name: MappingProxyType
+    by_slug: MappingProxyType
+    body: bytes
+
+
+class ShopCatalog:
+    def __init__(self, root: Path, snapshots: SnapshotCache | None = None):
+        self.root = root
+        self.image_by_slug = self._image_index(root / "image")
+        self.thumbnails = ThumbnailCache(root / "image", root / ".cache" / "thumbs")
+        self.key = hashlib.sha1("\n".join([*sorted(self.image_by_slug.values()), f"thumbs={self.thumbnails.available}"]).encode("utf-8")).hexdigest()
+        self.version = hashlib.sha1((root / "magasin.xlsx").read_bytes() + self.key.encode("ascii")).hexdigest()[:12]
+        self._workbook = XlsxMini.load_with_recovery(root / "magasin.xlsx", lazy=True, on_sheet=self._enrich_rows, snapshot=snapshots, snapshot_key=self.key)
+        self.names = tuple(self._workbook.sheets)
+        self._sheets: dict[str, ShopSheet] = {}
+        self._lock = threading.Lock()
+
+    def index(self) -> dict:
+        return {"sheets": list(self.names), "catalog": self.version}
+
+    def sheet(self, name: str) -> ShopSheet | None:
+        frozen = self._sheets.get(name)
+        if frozen is not None or name not in self.names:
+            return frozen
+        with self._lock:
+            if name not in self._sheets:
+                self._sheets[name] = self._freeze(name, self._workbook.sheets[name])
+                self._workbook.sheets[name] = list(self._sheets[name].rows)
+            return self._sheets[name]
+
+    def row(self, sheet: str, name: str) -> FrozenRow | None:
+        frozen = self.sheet(sheet)
+        if frozen is None:
+            return None
+        return frozen.by_name.get(name) or frozen.by_slug.get(CharacterAppStore._slug(name))
+
+    @staticmethod
+    def _freeze(sheet: str, rows: list[dict]) -> ShopSheet:
+        frozen = tuple(FrozenRow(row) for row in rows)
+        by_name, by_slug = {}, {}
+        for row in frozen:
+            name = row.get("nom de l'objet", "")
+            if name:
+                by_name.setdefault(name, row)
+                by_slug.setdefault(CharacterAppStore._slug(name), row)
+        body = json.dumps(frozen, ensure_ascii=False).encode("utf-8")
+        return ShopSheet(sheet, frozen, MappingProxyType(by_name), MappingProxyType(by_slug), body)
+
+    @staticmethod
+    def _image_index(image_dir: Path) -> dict[str, str]:
+        files = [f for f in image_dir.iterdir() if f.is_file()] if image_dir.exists() else []
+        return {CharacterAppStore._slug(f.stem): f"image/{f.name}" for f in files}
+
+    def _enrich_rows(self, sheet: str, rows: list[dict]):
+        by_slug = self.image_by_slug
+        for row in rows:
+            raw = str(row.get("image", "") or "").strip()
+            resolved = ""
+            if raw and raw not in {"#VALUE!", "#N/A"}:
+                resolved = raw if raw.startswith("http") or raw.startswith("image/") else f"image/{raw}"
+            if not resolved:
+                resolved = by_slug.get(CharacterAppStore._slug(row.get("nom de l'objet", "")), "")
+            row["resolved_image"] = resolved
+            row["resolved_thumbnail"] = self.thumbnails.url(resolved)
+            row["resolved_hit_modifier"] = (
+                row.get("Modificateur")
+                or row.get("Hit Mod")
+                or row.get("Hit Stat")
+                or (row.get("Hit") if not _is_number_text(str(row.get("Hit", "")).strip()) else "")
+                or row.get("modificateur")
+                or ""
+            )
+
+
+EQUIP_LIMITS = {"arme": 4, "equipement": 3}
+STACK_FIELDS = ("Objet", "type", "Prix unitaire (en crédit)", "poid unitaire (kg)")
+
+
+class RunningSum:
+    def __init__(self):
+        self._exact = Fraction(0)
+        self._special = {"nan": 0, "inf": 0, "-inf": 0}
+
+    def add(self, value: float, sign: int = 1):
+        if math.isfinite(value):
+            self._exact += sign * Fraction(value)
+        else:
+            self._special[repr(value)] += sign
+
+    @property
+    def value(self) -> float:
+        if self._special["nan"] or (self._special["inf"] and self._special["-inf"]):
+            return math.nan
+        if self._special["inf"] or self._special["-inf"]:
+            return math.inf if self._special["inf"] else -math.inf
+        return float(self._exact)
+
+
+class InventoryIndex:
+    BUCKETS = ("sac à dos", "coffre")
+
+    def __init__(self, workbook: WorkbookData):
+        self.workbook = workbook
+        self.rebuilds = 0
+        self.rebuild()
+
+    def rebuild(self):
+        self.positions: dict[str, tuple[str, int]] = {}
+        self.equipped = dict.fromkeys(EQUIP_LIMITS, 0)
+        self.currency = None
+        self._currency_stale = False
+        self.stacks: dict[str, dict[tuple, list[str]]] = {sheet: {} for sheet in self.BUCKETS}
+        self._stack_keys: dict[str, tuple[str, tuple]] = {}
+        self.totals = {sheet: {"weight": RunningSum(), "value": RunningSum()} for sheet in self.BUCKETS}
+        self.ac_bonus = 0
+        self._contributions: dict[int, tuple[str, float, float, int]] = {}
+        self._touched: dict[int, tuple[str, dict]] = {}
+        self.changed: set[str] = set()
+        for sheet in self.BUCKETS:
+            for pos, item in enumerate(self.workbook.sheets[sheet]):
+                self.positions.setdefault(item.get("id"), (sheet, pos))
+                self._attach(sheet, item)
+        self.rebuilds += 1
+
+    @staticmethod
+    def stack_key(item: dict) -> tuple:
+        return tuple(str(item.get(f, "")).strip().lower() for f in STACK_FIELDS)
+
+    def _index_stack(self, sheet: str, item: dict):
+        if item.get("type") == "currency":
+            return
+        key = self.stack_key(item)
+        self.stacks[sheet].setdefault(key, []).append(item.get("id"))
+        self._stack_keys[item.get("id")] = (sheet, key)
+
+    def _unindex_stack(self, item: dict):
+        entry = self._stack_keys.pop(item.get("id"), None)
+        if entry is None:
+            return
+        sheet, key = entry
+        ids = self.stacks[sheet].get(key, [])
+        if item.get("id") in ids:
+            ids.remove(item.get("id"))
+        if not ids:
+            self.stacks[sheet].pop(key, None)
+
+    def _stack_candidates(self, sheet: str, key: tuple) -> tuple[list[tuple[str, int, dict]], int]:
+        found = [self._verified(item_id) for item_id in self.stacks[sheet].get(key, ())]
+        return [f for f in found if f and f[0] == sheet and self.stack_key(f[2]) == key], len(found)
+
+    def stack_target(self, sheet: str, key: tuple) -> dict | None:
+        valid, total = self._stack_candidates(sheet, key)
+        if len(valid) != total:
+            self.rebuild()
+            valid, _ = self._stack_candidates(sheet, key)
+        return min(valid, key=lambda f: f[1])[2] if valid else None
+
+    def _track(self, item: dict, delta: int):
+        typ = item.get("type")
+        if typ in self.equipped and item.get("equiped") == "1":
+            self.equipped[typ] += delta
+        if typ == "currency" and delta > 0 and self.currency is None:
+            self.currency = item.get("id")
+        elif delta < 0 and item.get("id") == self.currency:
+            self.currency = None
+            self._currency_stale = True
+
+    def _flag(self, sheet: str, item: dict):
+        if sheet == "sac à dos" and item.get("type") in EQUIP_LIMITS:
+            self.changed.add(item.get("type"))
+
+    def account(self, sheet: str, item: dict):
+        self._discount(item)
+        to_float = CharacterAppStore._to_float
+        weight = value = 0.0
+        if item.get("type") != "currency":
+            weight = to_float(item.get("Poid (kg)", 0))
+            value = to_float(item.get("Valeur (en crédit)", 0))
+        ac = 0
+        if sheet == "sac à dos" and item.get("type") == "equipement" and item.get("equiped") == "1":
+            ac = int(to_float(item.get("bonus Armor class", "0"), 0))
+        self._contributions[id(item)] = (sheet, weight, value, ac)
+        self.totals[sheet]["weight"].add(weight)
+        self.totals[sheet]["value"].add(value)
+        self.ac_bonus += ac
+
+    def _discount(self, item: dict):
+        entry = self._contributions.pop(id(item), None)
+        if entry is None:
+            return
+        sheet, weight, value, ac = entry
+        self.totals[sheet]["weight"].add(weight, -1)
+        self.totals[sheet]["value"].add(value, -1)
+        self.ac_bonus -= ac
+
+    def touch(self, sheet: str, item: dict):
+        self._touched[id(item)] = (sheet, item)
+        self._flag(sheet, item)
+
+    def take_touched(self) -> list[tuple[str, dict]]:
+        touched = list(self._touched.values())
+        self._touched.clear()
+        return touched
+
+    def take_changed(self) -> set[str]:
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def weight(self, sheet: str) -> float:
+        return self.totals[sheet]["weight"].value
+
+    def value(self, sheet: str) -> float:
+        return self.totals[sheet]["value"].value
+
+    def _attach(self, sheet: str, item: dict):
+        self._index_stack(sheet, item)
+        if sheet == "sac à dos":
+            self._track(item, 1)
+        self.account(sheet, item)
+        self.touch(sheet, item)
+
+    def _detach(self, sheet: str, item: dict):
+        self._unindex_stack(item)
+        if sheet == "sac à dos":
+            self._track(item, -1)
+        self._discount(item)
+        self._touched.pop(id(item), None)
+        self._flag(sheet, item)
+
+    def _verified(self, item_id: str) -> tuple[str, int, dict] | None:
+        located = self.positions.get(item_id)
+        if located is not None:
+            sheet, pos = located
+            rows = self.workbook.sheets[sheet]
+            if pos < len(rows) and rows[pos].get("id") == item_id:
+                return sheet, pos, rows[pos]
+        return None
+
+    def find(self, item_id: str) -> tuple[str, int, dict] | None:
+        found = self._verified(item_id)
+        if found is None and item_id in self.positions:
+            self.rebuild()
+            found = self._verified(item_id)
+        return found
+
+    def currency_row(self) -> dict | None:
+        if self.currency is None and not self._currency_stale:
+            return None
+        found = self.find(self.currency) if self.currency else None
+        if found is None or found[0] != "sac à dos" or found[2].get("type") != "currency":
+            self.rebuild()
+            found = self.find(self.currency) if self.currency else None
+        return found[2] if found else None
+
+    def append(self, sheet: str, item: dict):
+        rows = self.workbook.sheets[sheet]
+        rows.append(item)
+        self.positions[item.get("id")] = (sheet, len(rows) - 1)
+        self._attach(sheet, item)
+
+    def pop(self, sheet: str, pos: int) -> dict:
+        rows = self.workbook.sheets[sheet]
+        item = rows.pop(pos)
+        if self.positions.get(item.get("id")) == (sheet, pos):
+            del self.positions[item.get("id")]
+        for p in range(pos, len(rows)):
+            self.positions[rows[p].get("id")] = (sheet, p)
+        self._detach(sheet, item)
+        return item
+
+    def pop_many(self, sheet: str, ids: set[str]) -> list[dict]:
+        rows = self.workbook.sheets[sheet]
+        kept, removed = [], []
+        for item in rows:
+            (removed if item.get("id") in ids else kept).append(item)
+        rows[:] = kept
+        for item in removed:
+            if self.positions.get(item.get("id"), ("",))[0] == sheet:
+                del self.positions[item.get("id")]
+            self._detach(sheet, item)
+        self.reindex(sheet)
+        return removed
+
+    def reindex(self, sheet: str):
+        for pos, item in enumerate(self.workbook.sheets[sheet]):
+            self.positions[item.get("id")] = (sheet, pos)
+        if sheet == "sac à dos":
+            self.changed.update(EQUIP_LIMITS)
+
+    def update(self, sheet: str, item: dict, fields: dict):
+        self._detach(sheet, item)
+        item.update(fields)
+        self._attach(sheet, item)
+
 
 class CharacterAppStore:
-    def __init__(self, root: Path):
+    def __init__(self, root: Path, write_behind: bool = False, flush_interval: float = 2.0, flush_threshold: int = 20, backups: int = 0, journal: bool = False, checkpoint_every: int = 200, snapshot: bool = True, shared_strings: bool = False, catalog: ShopCatalog | None = None):
         self.root = root
-        self.char = XlsxMini.load(root / "caracteristique.xlsx")
-        self.inv = XlsxMini.load(root / "inventaire.xlsx")
-        self.shop = XlsxMini.load(root / "magasin.xlsx")
-        self._enrich_shop_images()
+        self._snapshots = SnapshotCache(root / ".cache" / "snapshots") if snapshot else None
+        self.backups = backups
+        self.checkpoint_every = max(1, checkpoint_every)
+        self._journal = ActionJournal(root / "journal.jsonl") if journal else None
+        self._replay_ids: list[str] = []
+        self._action_ids: list[str] = []
+        self.version = 0
+        self.incarnation = uuid.uuid4().hex[:12]
+        self._section_versions = {name: 0 for name in STATE_SECTIONS}
+        self._state_cache: dict[str, tuple[int, object]] = {}
+        self.state_cache_stats = {"hits": 0, "misses": 0}
+        self._history: deque[tuple[int, dict]] = deque(maxlen=DELTA_HISTORY)
+        self.events = StateEvents()
+        if self._journal:
+            self._journal.recover()
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._view: StateView | None = None
+        self._dirty: dict[Path, WorkbookData] = {}
+        self.persist_stats = {"writes": {}, "skips": {}, "sheet_writes": 0, "sheet_skips": 0}
+        self.char = XlsxMini.load_with_recovery(root / "caracteristique.xlsx", snapshot=self._snapshots)
+        self.inv = XlsxMini.load_with_recovery(root / "inventaire.xlsx", snapshot=self._snapshots)
+        self.char.shared_strings = self.inv.shared_strings = shared_strings
+        self.catalog = catalog or ShopCatalog(root, self._snapshots)
+        self.thumbnails = self.catalog.thumbnails
+        self.catalog_version = self.catalog.version
         self._normalize_inventory()
+        self._items = InventoryIndex(self.inv)
+        self._weapons_effective = None
         self._ensure_hp_row()
         self.skill_branches, self.skill_by_id = self._build_skill_catalog()
         self._init_skill_tree()
+        if self._journal:
+            self._replay_journal()
+        self._publish()
+        self._flusher = WriteBehindFlusher(self.flush, flush_interval, flush_threshold) if write_behind else None
+
+    def _mark_dirty(self, *workbooks: WorkbookData):
+        for wb in workbooks:
+            self._dirty[wb.path] = wb
+
+    def _new_id(self) -> str:
+        new_id = self._replay_ids.pop(0) if self._replay_ids else str(uuid.uuid4())
+        self._action_ids.append(new_id)
+        return new_id
+
+    def _bump_version(self, action) -> int:
+        self.version += 1
+        for name in ACTION_SECTIONS.get(action, STATE_SECTIONS):
+            self._section_versions[name] = self.version
+        return self.version
+
+    def _cached(self, key: str, version, build):
+        cached = self._state_cache.get(key)
+        if cached is not None and cached[0] == version:
+            self.state_cache_stats["hits"] += 1
+            return cached[1]
+        self.state_cache_stats["misses"] += 1
+        value = build()
+        self._state_cache[key] = (version, value)
+        return value
+
+    def _replay_journal(self):
+        entries = self._journal.pending()
+        for entry in entries:
+            self._replay_ids = list(entry.get("ids", []))
+            for action in entry.get("actions", [entry.get("action", {})]):
+                self._run_action(action)
+        self._replay_ids = []
+        if entries:
+            print(f"Journal: {len(entries)} action(s) rejouée(s)")
+        self._mark_dirty(self.char, self.inv)
+        self.flush()
+
+    def _take_dirty(self) -> list[tuple[WorkbookData, WorkbookData]]:
+        stats = self.persist_stats
+        jobs = []
+        while self._dirty:
+            _, wb = self._dirty.popitem()
+            if wb.is_dirty():
+                jobs.append((wb, wb.snapshot()))
+            else:
+                stats["skips"][wb.path.name] = stats["skips"].get(wb.path.name, 0) + 1
+                stats["sheet_skips"] += len(wb.sheets)
+        return jobs
+
+    def _record_save(self, wb: WorkbookData, saved: WorkbookData, written: list[str]):
+        stats = self.persist_stats
+        wb.adopt(saved)
+        stats["writes"][wb.path.name] = stats["writes"].get(wb.path.name, 0) + 1
+        stats["sheet_writes"] += len(written)
+        stats["sheet_skips"] += len(saved.sheets) - len(written)
+
+    def flush(self):
+        with self._save_lock:
+            with self._lock:
+                jobs = self._take_dirty()
+                seq = self._journal.seq if self._journal else None
+            if self._journal:
+                self._checkpoint(jobs, seq)
+                return
+            for i, (wb, saved) in enumerate(jobs):
+                try:
+                    written = XlsxMini.save(saved, backups=self.backups)
+                except BaseException:
+                    with self._lock:
+                        self._mark_dirty(*(live for live, _ in jobs[i:]))
+                    raise
+                with self._lock:
+                    self._record_save(wb, saved, written)
+
+    def _checkpoint(self, jobs: list[tuple[WorkbookData, WorkbookData]], seq: int):
+        try:
+            results = self._journal.checkpoint([saved for _, saved in jobs], self.backups, seq)
+        except BaseException:
+            with self._lock:
+                self._mark_dirty(*(wb for wb, _ in jobs))
+            raise
+        with self._lock:
+            for (wb, _), (saved, written) in zip(jobs, results):
+                self._record_save(wb, saved, written)
+
+    def memory_estimate(self) -> int:
+        with self._lock:
+            size = sum(len(body) for body in self._view.encoded.values())
+            for wb in (self.char, self.inv):
+                for rows in wb.sheets.values():
+                    size += sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row.values())) for row in rows)
+            return size
+
+    def metrics(self):
+        with self._lock:
+            stats = self.persist_stats
+            return {
+                "persistence": {
+                    "writes": dict(stats["writes"]),
+                    "skips": dict(stats["skips"]),
+                    "sheet_writes": stats["sheet_writes"],
+                    "sheet_skips": stats["sheet_skips"],
+                    "pending": sorted(p.name for p in self._dirty),
+                    "journal_seq": self._journal.seq if self._journal else None,
+                    "journal_pending": self._journal.since_checkpoint if self._journal else 0,
+                },
+                "events": {"subscribers": len(self.events), "dropped": self.events.dropped},
+                "state_cache": {
+                    "version": self.version,
+                    "hits": self.state_cache_stats["hits"],
+                    "misses": self.state_cache_stats["misses"],
+                },
+                "inventory": {"indexed": len(self._items.positions), "rebuilds": self._items.rebuilds, "equipped": dict(self._items.equipped)},
+                "thumbnails": {"available": self.thumbnails.available, "generated": self.thumbnails.generated},
+                "snapshots": {
+                    "hits": self._snapshots.hits if self._snapshots else 0,
+                    "misses": self._snapshots.misses if self._snapshots else 0,
+                },
+            }
+
+    def close(self):
+        self.events.close()
+        if self._flusher:
+            self._flusher.close()
+            self._flusher = None
+        self.flush()
+        if self._journal:
+            self._journal.close()
+        if self._snapshots:
+            with self._lock:
+                for wb in (self.char, self.inv):
+                    if not wb.is_dirty():
+                        self._snapshots.refresh(wb)
 
     @staticmethod
     def _slug(value: str) -> str:
@@ -309,7 +1541,7 @@ class CharacterAppStore:
         text = str(v or "").strip().lower()
         text = unicodedata.normalize("NFKD", text)
         text = "".join(ch for ch in text if not unicodedata.combining(ch))
-        return re.sub(r"[^a-z]", "", text)
+        return _NON_ALPHA_RE.sub("", text)
 
     @staticmethod
     def _canonical_stat_key(v) -> str:
@@ -364,29 +1596,6 @@ class CharacterAppStore:
         short = target[:3]
         return next((v for k, v in effective_map.items() if k.startswith(short)), 0)
 
-    def _enrich_shop_images(self):
-        image_dir = self.root / "image"
-        files = [f for f in image_dir.iterdir() if f.is_file()] if image_dir.exists() else []
-        by_slug = {self._slug(f.stem): f"image/{f.name}" for f in files}
-
-        for sheet_rows in self.shop.sheets.values():
-            for row in sheet_rows:
-                raw = str(row.get("image", "") or "").strip()
-                resolved = ""
-                if raw and raw not in {"#VALUE!", "#N/A"}:
-                    resolved = raw if raw.startswith("http") or raw.startswith("image/") else f"image/{raw}"
-                if not resolved:
-                    resolved = by_slug.get(self._slug(row.get("nom de l'objet", "")), "")
-                row["resolved_image"] = resolved
-                row["resolved_hit_modifier"] = (
-                    row.get("Modificateur")
-                    or row.get("Hit Mod")
-                    or row.get("Hit Stat")
-                    or (row.get("Hit") if not re.fullmatch(r"-?\d+(\.\d+)?", str(row.get("Hit", "")).strip()) else "")
-                    or row.get("modificateur")
-                    or ""
-                )
-
     def _normalize_inventory(self):
         for bucket in ["sac à dos", "coffre"]:
             for item in self.inv.sheets.get(bucket, []):
@@ -417,17 +1626,18 @@ class CharacterAppStore:
             self.char.headers["Feuil1"].append("Expertise")
 
     def _bag_weight(self):
-        return sum(self._to_float(i.get("Poid (kg)", 0)) for i in self.inv.sheets["sac à dos"] if i.get("type") != "currency")
+        return self._items.weight("sac à dos")
 
     def _credits(self):
-        c = next((i for i in self.inv.sheets["sac à dos"] if i.get("type") == "currency"), None)
+        c = self._items.currency_row()
         return self._to_float(c.get("Valeur (en crédit)", 0)) if c else 0.0
 
     def _set_credits(self, value: float):
-        c = next((i for i in self.inv.sheets["sac à dos"] if i.get("type") == "currency"), None)
+        c = self._items.currency_row()
         if c:
             c["Valeur (en crédit)"] = str(round(value, 2))
             c["Prix unitaire (en crédit)"] = c["Valeur (en crédit)"]
+            self._items.touch("sac à dos", c)
 
     def _ensure_hp_row(self):
         row = next((r for r in self.char.sheets["Feuil1"] if self._normalize_key(r.get("Statistiques")) == "pv"), None)
@@ -569,6 +1779,9 @@ class CharacterAppStore:
         }
 
     def _compute_stats_context(self):
+        return self._cached("stats_context", self.version, self._stats_context)
+
+    def _stats_context(self):
         stats = []
         by_name = {}
         for r in self.char.sheets.get("Feuil1", []):
@@ -596,7 +1809,7 @@ class CharacterAppStore:
 
     def _weapon_hit_display(self, item: dict, effective_map: dict[str, float]) -> str:
         raw_hit = str(item.get("Hit", "") or "").strip()
-        base = self._to_float(raw_hit, 0) if re.fullmatch(r"-?\d+(\.\d+)?", raw_hit) else 0
+        base = self._to_float(raw_hit, 0) if _is_number_text(raw_hit) else 0
         mod_name = str(item.get("Hit Stat", "") or item.get("Modificateur", "") or (raw_hit if base == 0 else ""))
         stat_bonus = self._find_stat_bonus(effective_map, mod_name)
         spec = 2 if self._truthy(item.get("Hit Specialized", 0)) else 0
@@ -634,8 +1847,7 @@ class CharacterAppStore:
             })
 
         dex_bonus = next((s["bonus"] for s in stats if self._canonical_stat_key(s["name"]) == "dex"), 0)
-        ac_bonus = sum(int(self._to_float(i.get("bonus Armor class", "0"), 0)) for i in self.inv.sheets["sac à dos"] if i.get("type") == "equipement" and i.get("equiped") == "1")
-        armor_class = 9 + ac_bonus + dex_bonus
+        armor_class = 9 + self._items.ac_bonus + dex_bonus
         hp_row = self._hp_row() or {}
         con_bonus = next((s["bonus"] for s in stats if self._canonical_stat_key(s["name"]) == "con"), 0)
         hp_value = int(self._to_float(hp_row.get("Score", 10), 10))
@@ -648,27 +1860,22 @@ class CharacterAppStore:
             "hp": {"value": hp_value, "con_bonus": con_bonus},
         }
 
-    def _item_stack_key(self, i: dict):
-        fields = ["Objet", "type", "Prix unitaire (en crédit)", "poid unitaire (kg)"]
-        return tuple(str(i.get(f, "")).strip().lower() for f in fields)
-
     def _stack_into(self, sheet: str, item: dict):
-        if item.get("type") == "currency":
-            self.inv.sheets[sheet].append(item)
-            return
-        key = self._item_stack_key(item)
-        for existing in self.inv.sheets[sheet]:
-            if existing.get("type") == "currency":
+        self._stack_many(sheet, [item])
+
+    def _stack_many(self, sheet: str, items: list[dict]):
+        for item in items:
+            existing = None if item.get("type") == "currency" else self._items.stack_target(sheet, InventoryIndex.stack_key(item))
+            if existing is None:
+                self._items.append(sheet, item)
                 continue
-            if self._item_stack_key(existing) == key:
-                q = self._to_float(existing.get("Quantité", 0)) + self._to_float(item.get("Quantité", 0))
-                existing["Quantité"] = str(q)
-                return
-        self.inv.sheets[sheet].append(item)
+            q = self._to_float(existing.get("Quantité", 0)) + self._to_float(item.get("Quantité", 0))
+            existing["Quantité"] = str(q)
+            self._items.touch(sheet, existing)
 
     def _build_inventory(self):
-        bag = [i for i in self.inv.sheets["sac à dos"] if i.get("type") != "currency"]
-        chest = self.inv.sheets["coffre"]
+        bag = [dict(i) for i in self.inv.sheets["sac à dos"] if i.get("type") != "currency"]
+        chest = [dict(i) for i in self.inv.sheets["coffre"]]
         _, effective, max_carry, dex_penalty = self._compute_stats_context()
         weapons = []
         for i in bag:
@@ -683,28 +1890,143 @@ class CharacterAppStore:
             "weapons": weapons,
             "equipments": equipments,
             "bag_weight": self._bag_weight(),
+            "bag_value": self._items.value("sac à dos"),
+            "chest_value": self._items.value("coffre"),
             "max_carry": max_carry,
             "overweight": self._bag_weight() > max_carry,
             "dex_penalty": dex_penalty,
             "credits": self._credits(),
         }
 
-    def build_state(self):
+    def _section(self, name: str):
+        builders = {"stats": self._build_stats, "inventory": self._build_inventory, "skills_tree": self._build_skills_tree_state}
+        return self._cached(name, self._section_versions[name], builders[name])
+
+    def _publish(self):
+        sections = {name: self._section(name) for name in STATE_SECTIONS}
+        previous = self._view
+        encoded = {}
+        if previous is not None:
+            encoded = {
+                name: body for name, body in previous.encoded.items()
+                if name in sections and previous.section_versions[name] == self._section_versions[name]
+            }
+        self._view = StateView(self.version, dict(self._section_versions), sections, self.catalog.names, encoded)
+        self._history.append((self.version, sections))
+
+    def build_sections(self, names, view: StateView | None = None) -> dict:
+        view = view or self._view
+        return {"version": view.version, "incarnation": self.incarnation, **{name: view.sections[name] for name in names}}
+
+    def build_state(self, view: StateView | None = None):
+        view = view or self._view
         return {
-            "stats": self._build_stats(),
-            "inventory": self._build_inventory(),
-            "shop": self.shop.sheets,
-            "skills_tree": self._build_skills_tree_state(),
+            **self.build_sections(STATE_SECTIONS, view),
+            "shop_sheets": list(view.shop_sheets),
+            "shop_catalog": self.catalog_version,
         }
 
+    def encoded_state(self) -> tuple[int, bytes]:
+        view = self._view
+        return view.version, view.encode("state", lambda: self.build_state(view))
+
+    def encoded_section(self, name: str) -> tuple[int, bytes]:
+        view = self._view
+        return view.section_versions[name], view.encode(name, lambda: view.sections[name])
+
+    def _delta(self, base_version: int, incarnation: str | None):
+        if incarnation != self.incarnation:
+            return None
+        base = next((sections for version, sections in self._history if version == base_version), None)
+        if base is None:
+            return None
+        current = self._view.sections
+        return [op for name in STATE_SECTIONS for op in json_patch(base[name], current[name], f"/{name}")]
+
     def apply_action(self, payload: dict):
+        base_version, incarnation = payload.get("base_version"), payload.get("incarnation")
+        payload = {k: v for k, v in payload.items() if k not in {"base_version", "incarnation"}}
+        with self._lock:
+            previous = self.version
+            self._action_ids = []
+            feedback = self._run_action(payload)
+            if self._journal and feedback.get("ok", True):
+                self._journal.append({"action": payload, "ids": self._action_ids})
+            response = self._commit(previous, [payload.get("action")], base_version, incarnation)
+        self._schedule_save()
+        return {**feedback, **response}
+
+    def apply_actions(self, payloads: list[dict], base_version: int | None = None, incarnation: str | None = None):
+        with self._lock:
+            previous = self.version
+            backup = (self.char.snapshot(), self.inv.snapshot(), dict(self._section_versions))
+            self._action_ids = []
+            results = []
+            for index, payload in enumerate(payloads):
+                try:
+                    feedback = self._run_action(payload)
+                except BaseException:
+                    self._rollback(previous, backup)
+                    raise
+                if not feedback.get("ok", True):
+                    self._rollback(previous, backup)
+                    return {**feedback, "index": index}
+                results.append(feedback)
+            if not payloads:
+                return {"ok": True, "results": []}
+            if self._journal:
+                self._journal.append({"actions": payloads, "ids": self._action_ids})
+            response = self._commit(previous, [payload.get("action") for payload in payloads], base_version, incarnation)
+        self._schedule_save()
+        return {"ok": True, "results": results, **response}
+
+    def _rollback(self, previous: int, backup: tuple[WorkbookData, WorkbookData, dict[str, int]]):
+        char, inv, section_versions = backup
+        for wb, saved in ((self.char, char), (self.inv, inv)):
+            wb.sheets, wb.headers = saved.sheets, saved.headers
+        self.version = previous
+        self._section_versions = section_versions
+        self._state_cache = {key: cached for key, cached in self._state_cache.items() if cached[0] <= previous}
+        self._action_ids = []
+        self._items.rebuild()
+        self._weapons_effective = None
+
+    def _run_action(self, payload: dict) -> dict:
+        feedback = self._dispatch(payload)
+        self._bump_version(payload.get("action"))
+        self._sync_derived_tables()
+        return feedback
+
+    def _commit(self, previous: int, actions: list, base_version: int | None, incarnation: str | None = None) -> dict:
+        self._mark_dirty(self.char, self.inv)
+        self._publish()
+        if base_version is None:
+            sections = [name for name in STATE_SECTIONS if any(name in ACTION_SECTIONS.get(action, STATE_SECTIONS) for action in actions)]
+            response = {"state": self.build_sections(sections)}
+        else:
+            patch = self._delta(base_version, incarnation)
+            response = {"version": self.version, "incarnation": self.incarnation, "patch": patch} if patch is not None else {"state": self.build_sections(STATE_SECTIONS)}
+        if self.events:
+            patch = response["patch"] if base_version == previous and "patch" in response else self._delta(previous, self.incarnation)
+            self.events.publish({"type": "patch", "incarnation": self.incarnation, "base": previous, "version": self.version, "patch": patch})
+        return response
+
+    def _schedule_save(self):
+        if self._flusher:
+            self._flusher.notify()
+        elif not self._journal or self._journal.since_checkpoint >= self.checkpoint_every:
+            self.flush()
+
+    def _dispatch(self, payload: dict):
         action = payload.get("action")
         feedback = {"ok": True}
         if action == "update_stat": self._update_stat(payload)
         elif action == "toggle_skill": self._toggle_skill(payload)
         elif action == "toggle_expertise": self._toggle_expertise(payload)
         elif action == "add_item": feedback = self._add_item(payload)
+        elif action == "add_items": feedback = self._add_items(payload)
         elif action == "transfer_item": self._transfer(payload)
+        elif action == "transfer_items": self._transfer_many(payload)
         elif action == "assign_type": self._assign_type(payload)
         elif action == "toggle_equip": self._toggle_equip(payload)
         elif action == "buy": feedback = self._buy(payload)
@@ -715,11 +2037,7 @@ class CharacterAppStore:
         elif action == "add_skill_xp": self._add_skill_xp(payload)
         elif action == "buy_skill_tree": feedback = self._buy_skill_tree(payload)
         elif action == "update_hp": self._update_hp(payload)
-
-        self._sync_derived_tables()
-        XlsxMini.save(self.char)
-        XlsxMini.save(self.inv)
-        return {**feedback, "state": self.build_state()}
+        return feedback
 
     def _add_skill_xp(self, payload):
         amount = max(0, int(self._to_float(payload.get("amount", 0), 0)))
@@ -794,55 +2112,69 @@ class CharacterAppStore:
                 r["Expertise"] = "1" if payload.get("expertise") else "0"
 
     def _add_item(self, payload):
-        item = dict(payload.get("item", {}))
-        name = str(item.get("Objet", "")).strip()
-        raw_price = str(item.get("Prix unitaire (en crédit)", "")).strip()
-        if not name:
-            return {"ok": False, "error": "Le nom de l'objet est obligatoire."}
-        if raw_price == "" or not re.fullmatch(r"-?\d+(\.\d+)?", raw_price):
-            return {"ok": False, "error": "Le prix unitaire est obligatoire et doit être un nombre."}
-
-        item["Objet"] = name
-        item["Prix unitaire (en crédit)"] = raw_price
-        item.setdefault("id", str(uuid.uuid4()))
-        item.setdefault("equiped", "0")
-        if item.get("type") not in {"arme", "equipement", "item", "currency"}:
-            if str(item.get("Range (ft)", "")).strip() or str(item.get("Hit", "")).strip() or str(item.get("Damage", "")).strip():
-                item["type"] = "arme"
-            elif str(item.get("bonus Armor class", "")).strip() or str(item.get("effet(optionel)", "")).strip():
-                item["type"] = "equipement"
-            else:
-                item["type"] = "item"
-        self._stack_into("sac à dos", item)
+        return self._add_items({"items": [payload.get("item", {})]})
+
+    def _add_items(self, payload):
+        items = [dict(item) for item in payload.get("items", [])]
+        for item in items:
+            raw_price = str(item.get("Prix unitaire (en crédit)", "")).strip()
+            if not str(item.get("Objet", "")).strip():
+                return {"ok": False, "error": "Le nom de l'objet est obligatoire."}
+            if raw_price == "" or not _is_number_text(raw_price):
+                return {"ok": False, "error": "Le prix unitaire est obligatoire et doit être un nombre."}
+
+        for item in items:
+            item["Objet"] = str(item.get("Objet", "")).strip()
+            item["Prix unitaire (en crédit)"] = str(item.get("Prix unitaire (en crédit)", "")).strip()
+            if "id" not in item:
+                item["id"] = self._new_id()
+            item.setdefault("equiped", "0")
+            if item.get("type") not in {"arme", "equipement", "item", "currency"}:
+                if str(item.get("Range (ft)", "")).strip() or str(item.get("Hit", "")).strip() or str(item.get("Damage", "")).strip():
+                    item["type"] = "arme"
+                elif str(item.get("bonus Armor class", "")).strip() or str(item.get("effet(optionel)", "")).strip():
+                    item["type"] = "equipement"
+                else:
+                    item["type"] = "item"
+        self._stack_many("sac à dos", items)
         return {"ok": True}
 
     def _transfer(self, payload):
-        src = self.inv.sheets[payload["from"]]
-        dst_name = payload["to"]
-        idx = next((i for i, it in enumerate(src) if it.get("id") == payload["id"]), None)
-        if idx is None:
+        found = self._items.find(payload["id"])
+        if found is None or found[0] != payload["from"]:
             return
-        item = src[idx]
-        if item.get("type") == "currency":
+        sheet, idx, item = found
+        dst_name = payload["to"]
+        if item.get("type") == "currency" or dst_name not in InventoryIndex.BUCKETS:
             return
         qty = max(1, int(self._to_float(payload.get("qty", 1), 1)))
         stock = int(self._to_float(item.get("Quantité", 1), 1))
         qty = min(qty, stock)
         if qty == stock:
-            self._stack_into(dst_name, src.pop(idx))
+            self._stack_into(dst_name, self._items.pop(sheet, idx))
             return
         moved = dict(item)
-        moved["id"] = str(uuid.uuid4())
+        moved["id"] = self._new_id()
         moved["Quantité"] = str(qty)
         item["Quantité"] = str(stock - qty)
+        self._items.touch(sheet, item)
         self._stack_into(dst_name, moved)
 
+    def _transfer_many(self, payload):
+        src, dst = payload["from"], payload["to"]
+        if src not in InventoryIndex.BUCKETS or dst not in InventoryIndex.BUCKETS or src == dst:
+            return
+        wanted = set(payload["ids"]) if "ids" in payload else None
+        ids = {i.get("id") for i in self.inv.sheets[src] if i.get("type") != "currency" and (wanted is None or i.get("id") in wanted)}
+        self._stack_many(dst, self._items.pop_many(src, ids))
+
     def _assign_type(self, payload):
-        item = self._find_item(payload["id"])
-        if not item:
+        found = self._items.find(payload["id"])
+        if not found:
             return
+        sheet, _, item = found
         typ = payload["type"]
-        item["type"] = typ
+        self._items.update(sheet, item, {"type": typ})
         if typ == "arme":
             for key in ["Range (ft)", "Hit", "Damage", "Hit Stat", "Hit Specialized"]:
                 if key in payload:
@@ -854,28 +2186,19 @@ class CharacterAppStore:
                 item["effet(optionel)"] = payload.get("effet(optionel)", item.get("effet(optionel)", "ho le nul il a pas d'effets"))
 
     def _toggle_equip(self, payload):
-        item = self._find_item(payload["id"])
-        if not item:
+        found = self._items.find(payload["id"])
+        if not found:
             return
+        sheet, _, item = found
         typ = item.get("type")
-        if payload.get("equiped"):
-            if typ == "arme" and len([i for i in self.inv.sheets["sac à dos"] if i.get("type") == "arme" and i.get("equiped") == "1"]) >= 4:
-                return
-            if typ == "equipement" and len([i for i in self.inv.sheets["sac à dos"] if i.get("type") == "equipement" and i.get("equiped") == "1"]) >= 3:
-                return
-        item["equiped"] = "1" if payload.get("equiped") else "0"
-
-    def _find_item(self, item_id: str):
-        for sheet in ["sac à dos", "coffre"]:
-            for it in self.inv.sheets[sheet]:
-                if it.get("id") == item_id:
-                    return it
-        return None
+        if payload.get("equiped") and item.get("equiped") != "1" and typ in EQUIP_LIMITS and self._items.equipped[typ] >= EQUIP_LIMITS[typ]:
+            return
+        self._items.update(sheet, item, {"equiped": "1" if payload.get("equiped") else "0"})
 
     def _buy(self, payload):
         sheet, name = payload["sheet"], payload["name"]
         qty = max(1, int(payload.get("qty", 1)))
-        row = next((r for r in self.shop.sheets[sheet] if r.get("nom de l'objet") == name), None)
+        row = self.catalog.row(sheet, name)
         if not row:
             return {"ok": False, "error": "Objet introuvable"}
         price = self._to_float(row.get("prix unitaire (crédit)", 0))
@@ -884,7 +2207,7 @@ class CharacterAppStore:
         if credits < total:
             return {"ok": False, "error": "Fonds insuffisants", "missing_credits": round(total - credits, 2)}
         raw_hit = str(row.get("Hit", "") or "").strip()
-        hit_is_number = bool(re.fullmatch(r"-?\d+(\.\d+)?", raw_hit))
+        hit_is_number = _is_number_text(raw_hit)
         hit_stat = (
             row.get("resolved_hit_modifier")
             or row.get("Hit Stat")
@@ -892,7 +2215,7 @@ class CharacterAppStore:
         )
         self._set_credits(credits - total)
         self._add_item({"item": {
-            "Objet": name,
+            "Objet": row.get("nom de l'objet", name),
             "Quantité": str(qty),
             "Prix unitaire (en crédit)": str(price),
             "description": row.get("description", ""),
@@ -907,32 +2230,32 @@ class CharacterAppStore:
         return {"ok": True}
 
     def _sell(self, payload):
-        item = self._find_item(payload["id"])
-        if not item or item.get("type") == "currency":
+        found = self._items.find(payload["id"])
+        if not found or found[2].get("type") == "currency":
             return
+        sheet, idx, item = found
         qty = max(1, int(payload.get("qty", 1)))
         stock = int(self._to_float(item.get("Quantité", 1), 1))
         qty = min(qty, stock)
         self._set_credits(self._credits() + self._to_float(item.get("Prix unitaire (en crédit)", 0)) * qty)
         left = stock - qty
         if left <= 0:
-            for sheet in ["sac à dos", "coffre"]:
-                self.inv.sheets[sheet] = [i for i in self.inv.sheets[sheet] if i.get("id") != item.get("id")]
+            self._items.pop(sheet, idx)
         else:
             item["Quantité"] = str(left)
+            self._items.touch(sheet, item)
 
     def _update_item(self, payload):
-        item = self._find_item(payload["id"])
-        if not item:
+        found = self._items.find(payload["id"])
+        if not found:
             return
         allowed = ["description", "effet(optionel)", "poid unitaire (kg)", "Prix unitaire (en crédit)", "Quantité", "Range (ft)", "Hit", "Damage", "Hit Stat", "Hit Specialized", "bonus Armor class", "type"]
-        for key in allowed:
-            if key in payload:
-                item[key] = str(payload[key])
+        self._items.update(found[0], found[2], {key: str(payload[key]) for key in allowed if key in payload})
 
     def _sort(self, payload):
         key = payload["key"]
-        source = self.inv.sheets[payload.get("source", "sac à dos")]
+        sheet = payload.get("source", "sac à dos")
+        source = self.inv.sheets[sheet]
         if key == "alpha":
             source.sort(key=lambda x: x.get("Objet", "").lower())
         elif key == "prix":
@@ -943,24 +2266,29 @@ class CharacterAppStore:
             source.sort(key=lambda x: self._to_float(
                 x.get("Poid (kg)", self._to_float(x.get("poid unitaire (kg)", 0)) * self._to_float(x.get("Quantité", 1), 1))
             ))
+        if sheet in InventoryIndex.BUCKETS:
+            self._items.reindex(sheet)
 
     def _sync_derived_tables(self):
-        for sheet in ["sac à dos", "coffre"]:
-            for item in self.inv.sheets[sheet]:
-                q = self._to_float(item.get("Quantité", 1), 1)
-                pu = self._to_float(item.get("Prix unitaire (en crédit)", 0), 0)
-                wu = self._to_float(item.get("poid unitaire (kg)", 0), 0)
-                if item.get("type") != "currency":
-                    item["Valeur (en crédit)"] = str(round(q * pu, 2))
-                item["Poid (kg)"] = str(round(q * wu, 2))
-
+        for sheet, item in self._items.take_touched():
+            q = self._to_float(item.get("Quantité", 1), 1)
+            pu = self._to_float(item.get("Prix unitaire (en crédit)", 0), 0)
+            wu = self._to_float(item.get("poid unitaire (kg)", 0), 0)
+            if item.get("type") != "currency":
+                item["Valeur (en crédit)"] = str(round(q * pu, 2))
+            item["Poid (kg)"] = str(round(q * wu, 2))
+            self._items.account(sheet, item)
+
+        changed = self._items.take_changed()
         _, effective, _, _ = self._compute_stats_context()
-        self.inv.sheets["armes"] = [
-            {"Armes": i.get("Objet", ""), "Range (ft)": i.get("Range (ft)", ""), "Hit": self._weapon_hit_display(i, effective), "Damage": i.get("Damage", ""), "description": i.get("description", "")}
-            for i in self.inv.sheets["sac à dos"] if i.get("type") == "arme"
-        ]
-        self.inv.sheets["equipement"] = [
-            {"Equipement": i.get("Objet", ""), "bonus Armor class": i.get("bonus Armor class", "0"), "effet(optionel)": i.get("effet(optionel)", "ho le nul il a pas d'effets"), "description": i.get("description", "")}
-            for i in self.inv.sheets["sac à dos"] if i.get("type") == "equipement"
-        ]
-        XlsxMini.save(self.shop)
+        if "arme" in changed or effective != self._weapons_effective:
+            self._weapons_effective = effective
+            self.inv.sheets["armes"] = [
+                {"Armes": i.get("Objet", ""), "Range (ft)": i.get("Range (ft)", ""), "Hit": self._weapon_hit_display(i, effective), "Damage": i.get("Damage", ""), "description": i.get("description", "")}
+                for i in self.inv.sheets["sac à dos"] if i.get("type") == "arme"
+            ]
+        if "equipement" in changed:
+            self.inv.sheets["equipement"] = [
+                {"Equipement": i.get("Objet", ""), "bonus Armor class": i.get("bonus Armor class", "0"), "effet(optionel)": i.get("effet(optionel)", "ho le nul il a pas d'effets"), "description": i.get("description", "")}
+                for i in self.inv.sheets["sac à dos"] if i.get("type") == "equipement"
+            ]